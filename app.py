@@ -1,19 +1,31 @@
 import calendar
 import hashlib
 import hmac
+import multiprocessing
 import os
+import queue
 import shutil
+import sqlite3
 import tempfile
+import threading
 import tkinter as tk
 import tkinter.font as tkfont
 import webbrowser
+from datetime import date
 from tkinter import ttk, messagebox, filedialog
 
 DEFAULT_USERNAME = "admin"
 DEFAULT_PASSWORD = "admin123"
+LIST_PAGE_SIZE = 200
 
+import billing
 import db
-from reports import generate_customer_receipt
+from reports import (
+    generate_batch_receipts,
+    generate_customer_receipt,
+    generate_route_receipts,
+    month_dates,
+)
 from tkcalendar import DateEntry
 
 
@@ -49,6 +61,7 @@ class MilkBillingApp(tk.Tk):
         self._build_allocations_tab()
         self._build_reports_tab()
         self._build_lists_tab()
+        self.bind_all("<Control-Shift-D>", lambda _e: self._show_db_stats())
 
     def _build_masters_tab(self):
         frame = ttk.Frame(self.notebook)
@@ -423,28 +436,79 @@ class MilkBillingApp(tk.Tk):
             image=self.icons.get("save"),
             compound="left",
         ).grid(row=6, column=1, sticky="e", padx=5, pady=8)
+        standing = ttk.Frame(frame)
+        standing.grid(row=7, column=0, columnspan=2, sticky="w", padx=5, pady=4)
+        ttk.Label(standing, text="Standing Orders From").grid(row=0, column=0, sticky="w")
+        self.standing_from_var = tk.StringVar(value=db.today_str())
+        self._build_date_dropdown(standing, 0, 1, self.standing_from_var)
+        ttk.Label(standing, text="To").grid(row=0, column=2, sticky="w")
+        self.standing_to_var = tk.StringVar(value=db.today_str())
+        self._build_date_dropdown(standing, 0, 3, self.standing_to_var)
+        ttk.Button(
+            standing,
+            text="Save as Standing Order",
+            command=self._add_standing_order,
+            style="Secondary.TButton",
+        ).grid(row=0, column=4, padx=5)
+        ttk.Button(
+            standing,
+            text="Generate Standing Orders",
+            command=self._generate_standing_deliveries,
+            style="Secondary.TButton",
+        ).grid(row=0, column=5, padx=5)
+        ttk.Label(standing, text="Standing Order Ends").grid(row=1, column=0, sticky="w")
+        self.standing_end_entry = ttk.Entry(standing, width=14)
+        self.standing_end_entry.grid(row=1, column=1, padx=5, pady=4, sticky="w")
+        ttk.Label(standing, text="YYYY-MM-DD, blank for no end").grid(
+            row=1, column=2, columnspan=2, sticky="w"
+        )
+        ttk.Button(
+            standing,
+            text="Stop Selected",
+            command=self._stop_standing_order,
+            style="Secondary.TButton",
+        ).grid(row=1, column=5, padx=5)
+        self.standing_list = ttk.Treeview(
+            standing,
+            columns=("id", "customer", "item", "quantity", "partner", "start", "end"),
+            show="headings",
+            height=4,
+        )
+        self.standing_list.heading("id", text="ID")
+        self.standing_list.heading("customer", text="Customer")
+        self.standing_list.heading("item", text="Item")
+        self.standing_list.heading("quantity", text="Qty")
+        self.standing_list.heading("partner", text="Partner")
+        self.standing_list.heading("start", text="Starts")
+        self.standing_list.heading("end", text="Ends")
+        self.standing_list.column("id", width=0, stretch=False)
+        self.standing_list.column("quantity", width=50)
+        self.standing_list.column("start", width=90)
+        self.standing_list.column("end", width=90)
+        self.standing_list.grid(row=2, column=0, columnspan=6, sticky="ew", pady=4)
+        self._refresh_standing_orders()
 
         ttk.Separator(frame, orient="horizontal").grid(
-            row=7, column=0, columnspan=2, sticky="ew", pady=8
+            row=8, column=0, columnspan=2, sticky="ew", pady=8
         )
 
-        ttk.Label(frame, text="Advance Payment").grid(row=8, column=0, sticky="w")
-        ttk.Label(frame, text="Customer").grid(row=9, column=0, sticky="w")
-        ttk.Label(frame, text="Amount").grid(row=10, column=0, sticky="w")
-        ttk.Label(frame, text="Date").grid(row=11, column=0, sticky="w")
-        ttk.Label(frame, text="Notes").grid(row=12, column=0, sticky="w")
+        ttk.Label(frame, text="Advance Payment").grid(row=9, column=0, sticky="w")
+        ttk.Label(frame, text="Customer").grid(row=10, column=0, sticky="w")
+        ttk.Label(frame, text="Amount").grid(row=11, column=0, sticky="w")
+        ttk.Label(frame, text="Date").grid(row=12, column=0, sticky="w")
+        ttk.Label(frame, text="Notes").grid(row=13, column=0, sticky="w")
 
         self.payment_customer = ttk.Combobox(frame, width=35)
         self.payment_amount = ttk.Entry(frame, width=20)
         self.payment_date_var = tk.StringVar(value=db.today_str())
         self.payment_date_entry = self._build_date_dropdown(
-            frame, 11, 1, self.payment_date_var
+            frame, 12, 1, self.payment_date_var
         )
         self.payment_notes = ttk.Entry(frame, width=40)
 
-        self.payment_customer.grid(row=9, column=1, padx=5, pady=4, sticky="w")
-        self.payment_amount.grid(row=10, column=1, padx=5, pady=4, sticky="w")
-        self.payment_notes.grid(row=12, column=1, padx=5, pady=4, sticky="w")
+        self.payment_customer.grid(row=10, column=1, padx=5, pady=4, sticky="w")
+        self.payment_amount.grid(row=11, column=1, padx=5, pady=4, sticky="w")
+        self.payment_notes.grid(row=13, column=1, padx=5, pady=4, sticky="w")
 
         ttk.Button(
             frame,
@@ -453,7 +517,7 @@ class MilkBillingApp(tk.Tk):
             style="Primary.TButton",
             image=self.icons.get("money"),
             compound="left",
-        ).grid(row=13, column=1, sticky="e", padx=5, pady=8)
+        ).grid(row=14, column=1, sticky="e", padx=5, pady=8)
 
         frame.columnconfigure(1, weight=1)
         frame.columnconfigure(0, weight=1)
@@ -510,14 +574,24 @@ class MilkBillingApp(tk.Tk):
         self.summary_partner = ttk.Combobox(frame, width=35)
         self.summary_partner.grid(row=9, column=1, padx=5, pady=4, sticky="w")
 
+        summary_buttons = ttk.Frame(frame)
+        summary_buttons.grid(row=10, column=0, columnspan=2, sticky="e", padx=5, pady=8)
         ttk.Button(
-            frame,
+            summary_buttons,
+            text="All Partners",
+            command=self._load_stock_position,
+            style="Secondary.TButton",
+            image=self.icons.get("summary"),
+            compound="left",
+        ).pack(side="left")
+        ttk.Button(
+            summary_buttons,
             text="Load Summary",
             command=self._load_partner_summary,
             style="Secondary.TButton",
             image=self.icons.get("summary"),
             compound="left",
-        ).grid(row=10, column=1, sticky="e", padx=5, pady=8)
+        ).pack(side="left", padx=(8, 0))
 
         self.partner_summary = tk.Text(
             frame,
@@ -589,8 +663,87 @@ class MilkBillingApp(tk.Tk):
             compound="left",
         ).grid(row=7, column=1, sticky="e", padx=5, pady=8)
 
+        ttk.Label(frame, text="Route Receipts (Date Range)").grid(
+            row=8, column=0, sticky="w"
+        )
+        self.report_route_partner = ttk.Combobox(frame, width=35)
+        self.report_route_partner.grid(row=8, column=1, padx=5, pady=4, sticky="w")
+        ttk.Button(
+            frame,
+            text="Preview Route PDF",
+            command=self._generate_route_receipts,
+            style="Primary.TButton",
+            image=self.icons.get("preview"),
+            compound="left",
+        ).grid(row=8, column=1, sticky="e", padx=5, pady=8)
+
+        ttk.Separator(frame, orient="horizontal").grid(
+            row=9, column=0, columnspan=2, sticky="ew", pady=10
+        )
+
+        ttk.Label(frame, text="Month-End Billing").grid(row=10, column=0, sticky="w")
+        self.billing_month = self._build_month_selector(frame, 10, 1)
+        billing_buttons = ttk.Frame(frame)
+        billing_buttons.grid(row=11, column=1, sticky="w", padx=5, pady=4)
+        ttk.Button(
+            billing_buttons,
+            text="Run Billing",
+            command=self._run_billing,
+            style="Primary.TButton",
+        ).pack(side="left")
+        ttk.Button(
+            billing_buttons,
+            text="Export CSV",
+            command=self._export_billing,
+            style="Secondary.TButton",
+        ).pack(side="left", padx=(8, 0))
+        self.billing_receipts_button = ttk.Button(
+            billing_buttons,
+            text="Receipts ZIP",
+            command=self._generate_billing_receipts,
+            style="Secondary.TButton",
+        )
+        self.billing_receipts_button.pack(side="left", padx=(8, 0))
+        self.billing_cancel_button = ttk.Button(
+            billing_buttons,
+            text="Cancel",
+            command=self._cancel_billing_receipts,
+            style="Secondary.TButton",
+            state="disabled",
+        )
+        self.billing_cancel_button.pack(side="left", padx=(8, 0))
+        self.billing_status_var = tk.StringVar(value="")
+        ttk.Label(frame, textvariable=self.billing_status_var).grid(
+            row=11, column=0, sticky="w"
+        )
+
+        self.billing_list = ttk.Treeview(
+            frame,
+            columns=billing.BILL_COLUMNS,
+            show="headings",
+            height=10,
+        )
+        self.billing_list.heading("customer_id", text="ID")
+        self.billing_list.heading("customer_name", text="Customer")
+        self.billing_list.heading("qty", text="Qty")
+        self.billing_list.heading("opening", text="Opening")
+        self.billing_list.heading("amount", text="Charges")
+        self.billing_list.heading("paid", text="Paid")
+        self.billing_list.heading("due", text="Due")
+        self.billing_list.column("customer_id", width=0, stretch=False)
+        self.billing_list.column("customer_name", width=180)
+        for column in ("qty", "opening", "amount", "paid", "due"):
+            self.billing_list.column(column, width=90, anchor="e")
+        billing_scroll = ttk.Scrollbar(frame, orient="vertical", command=self.billing_list.yview)
+        self.billing_list.configure(yscrollcommand=billing_scroll.set)
+        self.billing_list.grid(row=12, column=0, columnspan=2, sticky="nsew", padx=5, pady=6)
+        billing_scroll.grid(row=12, column=2, sticky="ns", pady=6)
+        self._billing_bills = []
+        self._billing_receipts_cancel = None
+
         frame.columnconfigure(1, weight=1)
         frame.columnconfigure(0, weight=1)
+        frame.rowconfigure(12, weight=1)
         self._refresh_all_dropdowns()
 
     def _build_lists_tab(self):
@@ -660,6 +813,12 @@ class MilkBillingApp(tk.Tk):
         delivery_scroll.grid(row=1, column=3, sticky="ns", pady=6)
         self.delivery_list.bind("<<TreeviewSelect>>", self._on_delivery_select)
 
+        ttk.Button(
+            frame,
+            text="Load More",
+            command=self._load_more_deliveries,
+            style="Secondary.TButton",
+        ).grid(row=2, column=0, sticky="w", padx=5, pady=6)
         ttk.Button(
             frame,
             text="Update Selected",
@@ -717,6 +876,12 @@ class MilkBillingApp(tk.Tk):
         payment_scroll.grid(row=1, column=3, sticky="ns", pady=6)
         self.payment_list.bind("<<TreeviewSelect>>", self._on_payment_select)
 
+        ttk.Button(
+            frame,
+            text="Load More",
+            command=self._load_more_payments,
+            style="Secondary.TButton",
+        ).grid(row=2, column=0, sticky="w", padx=5, pady=6)
         ttk.Button(
             frame,
             text="Update Selected",
@@ -775,6 +940,12 @@ class MilkBillingApp(tk.Tk):
         alloc_scroll.grid(row=1, column=3, sticky="ns", pady=6)
         self.allocation_list.bind("<<TreeviewSelect>>", self._on_allocation_select)
 
+        ttk.Button(
+            frame,
+            text="Load More",
+            command=self._load_more_allocations,
+            style="Secondary.TButton",
+        ).grid(row=2, column=0, sticky="w", padx=5, pady=6)
         ttk.Button(
             frame,
             text="Update Selected",
@@ -854,6 +1025,8 @@ class MilkBillingApp(tk.Tk):
             self._set_combo_values(self.alloc_partner, partners)
         if hasattr(self, "summary_partner"):
             self._set_combo_values(self.summary_partner, partners)
+        if hasattr(self, "report_route_partner"):
+            self._set_combo_values(self.report_route_partner, partners)
         if hasattr(self, "delivery_item"):
             self._set_combo_values(self.delivery_item, items)
         if hasattr(self, "alloc_item"):
@@ -1003,19 +1176,112 @@ class MilkBillingApp(tk.Tk):
             messagebox.showerror("Validation", "Selected item has no price.")
             return
 
-        db.add_daily_delivery(
-            delivery_date,
+        try:
+            db.add_daily_delivery(
+                delivery_date,
+                customer_id,
+                item_id,
+                quantity,
+                item_price,
+                delivery_partner_id,
+                manager_id,
+            )
+        except sqlite3.IntegrityError:
+            messagebox.showerror(
+                "Duplicate",
+                "A delivery for this customer, item and partner already exists on that date.",
+            )
+            return
+        self.delivery_quantity.delete(0, tk.END)
+        self.selected_delivery_id = None
+        self._load_deliveries_for_date()
+        messagebox.showinfo("Saved", "Delivery recorded.")
+
+    def _add_standing_order(self):
+        customer_id = self._get_combo_id(self.delivery_customer)
+        item_id = self._get_combo_id(self.delivery_item)
+        delivery_partner_id = self._get_combo_id(self.delivery_partner)
+        manager_id = self._get_combo_id(self.delivery_manager)
+        quantity_raw = self.delivery_quantity.get().strip()
+
+        if not all([customer_id, item_id, delivery_partner_id, manager_id]):
+            messagebox.showerror("Validation", "Please fill all delivery fields.")
+            return
+        try:
+            quantity = int(quantity_raw)
+        except ValueError:
+            messagebox.showerror("Validation", "Quantity must be an integer.")
+            return
+
+        start_date = self.standing_from_var.get().strip()
+        end_date = self.standing_end_entry.get().strip()
+        if end_date:
+            try:
+                end_date = date.fromisoformat(end_date).strftime("%Y-%m-%d")
+            except ValueError:
+                messagebox.showerror("Validation", "End date must be YYYY-MM-DD.")
+                return
+            if start_date and end_date < start_date:
+                messagebox.showerror("Validation", "End date cannot be before start date.")
+                return
+        db.add_standing_order(
             customer_id,
             item_id,
             quantity,
-            item_price,
             delivery_partner_id,
             manager_id,
+            end_date=end_date or None,
+            start_date=start_date or None,
         )
         self.delivery_quantity.delete(0, tk.END)
-        self.selected_delivery_id = None
+        self.standing_end_entry.delete(0, tk.END)
+        self._refresh_standing_orders()
+        messagebox.showinfo("Saved", "Standing order saved.")
+
+    def _refresh_standing_orders(self):
+        self.standing_list.delete(*self.standing_list.get_children())
+        for row in db.list_standing_orders():
+            self.standing_list.insert(
+                "",
+                "end",
+                values=(
+                    row["id"],
+                    row["customer_name"],
+                    row["item_name"],
+                    row["quantity"],
+                    row["partner_name"],
+                    row["start_date"] or "",
+                    row["end_date"] or "",
+                ),
+            )
+
+    def _stop_standing_order(self):
+        selected = self.standing_list.selection()
+        if not selected:
+            messagebox.showerror("Validation", "Select a standing order to stop.")
+            return
+        if not messagebox.askyesno("Confirm", "Stop selected standing order?"):
+            return
+        order_id = self.standing_list.item(selected[0])["values"][0]
+        db.deactivate_standing_order(order_id)
+        self._refresh_standing_orders()
+        messagebox.showinfo("Stopped", "Standing order stopped.")
+
+    def _generate_standing_deliveries(self):
+        start_date = self.standing_from_var.get().strip()
+        end_date = self.standing_to_var.get().strip()
+        if not start_date or not end_date:
+            messagebox.showerror("Validation", "From and To dates are required.")
+            return
+        try:
+            created = db.generate_standing_deliveries(start_date, end_date)
+        except ValueError as exc:
+            messagebox.showerror("Validation", str(exc))
+            return
         self._load_deliveries_for_date()
-        messagebox.showinfo("Saved", "Delivery recorded.")
+        messagebox.showinfo(
+            "Generated", f"{created} deliveries generated for {start_date} to {end_date}."
+        )
 
     def _build_date_dropdown(self, parent, row, column, date_var):
         wrapper = tk.Frame(
@@ -1113,24 +1379,64 @@ class MilkBillingApp(tk.Tk):
         self.partner_summary.delete("1.0", tk.END)
         self.partner_summary.insert(tk.END, "\n".join(lines))
 
+    def _load_stock_position(self):
+        summary_date = self.summary_date_var.get().strip()
+        if not summary_date:
+            messagebox.showerror("Validation", "Date is required.")
+            return
+        rows = db.partner_reconciliation(summary_date)
+
+        lines = [
+            f"Stock Position for {summary_date}",
+            "-" * 60,
+            f"{'Partner':<20}{'Item':<16}{'Allocated':>10}{'Delivered':>10}{'Remaining':>10}",
+        ]
+        for row in rows:
+            lines.append(
+                f"{row['partner_name'][:19]:<20}{row['item_name'][:15]:<16}"
+                f"{row['allocated']:>10}{row['delivered']:>10}{row['remaining']:>10}"
+            )
+        if not rows:
+            lines.append("No allocations or deliveries for this date.")
+
+        self.partner_summary.delete("1.0", tk.END)
+        self.partner_summary.insert(tk.END, "\n".join(lines))
+
     def _load_deliveries_for_date(self):
         delivery_date = (
             self.list_delivery_date_var.get().strip()
             if hasattr(self, "list_delivery_date_var")
             else self.delivery_date_var.get().strip()
         )
-        rows = db.list_daily_deliveries(delivery_date)
-        self._refresh_delivery_list(rows)
+        self._delivery_list_filter = delivery_date
+        self._load_delivery_page(reset=True)
 
     def _load_deliveries_all(self):
-        rows = db.list_daily_deliveries()
-        self._refresh_delivery_list(rows)
+        self._delivery_list_filter = None
+        self._load_delivery_page(reset=True)
+
+    def _load_more_deliveries(self):
+        self._load_delivery_page(reset=False)
+
+    def _load_delivery_page(self, reset):
+        after_id = None if reset else getattr(self, "_delivery_list_after_id", None)
+        if not reset and after_id is None:
+            messagebox.showinfo("Done", "No more deliveries to load.")
+            return
+        rows = db.list_daily_deliveries(
+            self._delivery_list_filter, after_id=after_id, page_size=LIST_PAGE_SIZE
+        )
+        self._refresh_delivery_list(rows, append=not reset)
+        self._delivery_list_after_id = (
+            rows[-1]["id"] if len(rows) == LIST_PAGE_SIZE else None
+        )
 
-    def _refresh_delivery_list(self, rows):
+    def _refresh_delivery_list(self, rows, append=False):
         if not hasattr(self, "delivery_list"):
             return
-        self.delivery_list.delete(*self.delivery_list.get_children())
-        self._delivery_rows = {}
+        if not append:
+            self.delivery_list.delete(*self.delivery_list.get_children())
+            self._delivery_rows = {}
         for row in rows:
             iid = str(row["id"])
             self._delivery_rows[iid] = row
@@ -1193,16 +1499,23 @@ class MilkBillingApp(tk.Tk):
             messagebox.showerror("Validation", "Selected item has no price.")
             return
 
-        db.update_daily_delivery(
-            self.selected_delivery_id,
-            delivery_date,
-            customer_id,
-            item_id,
-            quantity,
-            item_price,
-            delivery_partner_id,
-            manager_id,
-        )
+        try:
+            db.update_daily_delivery(
+                self.selected_delivery_id,
+                delivery_date,
+                customer_id,
+                item_id,
+                quantity,
+                item_price,
+                delivery_partner_id,
+                manager_id,
+            )
+        except sqlite3.IntegrityError:
+            messagebox.showerror(
+                "Duplicate",
+                "A delivery for this customer, item and partner already exists on that date.",
+            )
+            return
         self.selected_delivery_id = None
         self.delivery_quantity.delete(0, tk.END)
         self.delivery_customer.set("")
@@ -1229,18 +1542,35 @@ class MilkBillingApp(tk.Tk):
             if hasattr(self, "list_payment_date_var")
             else self.payment_date_var.get().strip()
         )
-        rows = db.list_advance_payments(payment_date)
-        self._refresh_payment_list(rows)
+        self._payment_list_filter = payment_date
+        self._load_payment_page(reset=True)
 
     def _load_payments_all(self):
-        rows = db.list_advance_payments()
-        self._refresh_payment_list(rows)
+        self._payment_list_filter = None
+        self._load_payment_page(reset=True)
 
-    def _refresh_payment_list(self, rows):
+    def _load_more_payments(self):
+        self._load_payment_page(reset=False)
+
+    def _load_payment_page(self, reset):
+        after_id = None if reset else getattr(self, "_payment_list_after_id", None)
+        if not reset and after_id is None:
+            messagebox.showinfo("Done", "No more payments to load.")
+            return
+        rows = db.list_advance_payments(
+            self._payment_list_filter, after_id=after_id, page_size=LIST_PAGE_SIZE
+        )
+        self._refresh_payment_list(rows, append=not reset)
+        self._payment_list_after_id = (
+            rows[-1]["id"] if len(rows) == LIST_PAGE_SIZE else None
+        )
+
+    def _refresh_payment_list(self, rows, append=False):
         if not hasattr(self, "payment_list"):
             return
-        self.payment_list.delete(*self.payment_list.get_children())
-        self._payment_rows = {}
+        if not append:
+            self.payment_list.delete(*self.payment_list.get_children())
+            self._payment_rows = {}
         for row in rows:
             iid = str(row["id"])
             self._payment_rows[iid] = row
@@ -1316,18 +1646,35 @@ class MilkBillingApp(tk.Tk):
             if hasattr(self, "list_allocation_date_var")
             else self.alloc_date_var.get().strip()
         )
-        rows = db.list_partner_allocations_all(allocation_date)
-        self._refresh_allocation_list(rows)
+        self._allocation_list_filter = allocation_date
+        self._load_allocation_page(reset=True)
 
     def _load_allocations_all(self):
-        rows = db.list_partner_allocations_all()
-        self._refresh_allocation_list(rows)
+        self._allocation_list_filter = None
+        self._load_allocation_page(reset=True)
+
+    def _load_more_allocations(self):
+        self._load_allocation_page(reset=False)
 
-    def _refresh_allocation_list(self, rows):
+    def _load_allocation_page(self, reset):
+        after_id = None if reset else getattr(self, "_allocation_list_after_id", None)
+        if not reset and after_id is None:
+            messagebox.showinfo("Done", "No more allocations to load.")
+            return
+        rows = db.list_partner_allocations_all(
+            self._allocation_list_filter, after_id=after_id, page_size=LIST_PAGE_SIZE
+        )
+        self._refresh_allocation_list(rows, append=not reset)
+        self._allocation_list_after_id = (
+            rows[-1]["id"] if len(rows) == LIST_PAGE_SIZE else None
+        )
+
+    def _refresh_allocation_list(self, rows, append=False):
         if not hasattr(self, "allocation_list"):
             return
-        self.allocation_list.delete(*self.allocation_list.get_children())
-        self._allocation_rows = {}
+        if not append:
+            self.allocation_list.delete(*self.allocation_list.get_children())
+            self._allocation_rows = {}
         for row in rows:
             iid = str(row["id"])
             self._allocation_rows[iid] = row
@@ -1633,6 +1980,7 @@ class MilkBillingApp(tk.Tk):
             f"{start_date} to {end_date}",
             deliveries,
             payments,
+            opening_paise=db.customer_opening_balance_paise(customer_id, start_date),
         )
         webbrowser.open(preview_path)
 
@@ -1649,6 +1997,159 @@ class MilkBillingApp(tk.Tk):
         shutil.copyfile(preview_path, file_path)
         messagebox.showinfo("Done", f"Receipt saved: {file_path}")
 
+    def _generate_route_receipts(self):
+        partner_id = self._get_combo_id(self.report_route_partner)
+        start_date = self.report_from_date_var.get().strip()
+        end_date = self.report_to_date_var.get().strip()
+        if not partner_id or not start_date or not end_date:
+            messagebox.showerror("Validation", "Delivery partner and date range are required.")
+            return
+
+        temp_dir = tempfile.mkdtemp()
+        preview_path = os.path.join(temp_dir, "route_receipts_preview.pdf")
+        count = generate_route_receipts(
+            preview_path,
+            self.shop_name,
+            self.shop_address,
+            self.shop_contact,
+            partner_id,
+            start_date,
+            end_date,
+        )
+        if not count:
+            messagebox.showinfo("Route Receipts", "No deliveries by this partner in the range.")
+            return
+        webbrowser.open(preview_path)
+
+        if not messagebox.askyesno(
+            "Save Receipts", f"Preview opened ({count} customers). Save these receipts?"
+        ):
+            return
+
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".pdf",
+            filetypes=[("PDF files", "*.pdf")],
+            title="Save Route Receipts",
+        )
+        if not file_path:
+            return
+        shutil.copyfile(preview_path, file_path)
+        messagebox.showinfo("Done", f"Route receipts saved: {file_path}")
+
+    def _run_billing(self):
+        month = self._get_month_value(self.billing_month)
+        bills, _ = db.month_end_billing(month)
+        self._billing_bills = bills
+        self._billing_month_value = month
+        self.billing_list.delete(*self.billing_list.get_children())
+        for bill in bills:
+            self.billing_list.insert(
+                "",
+                tk.END,
+                values=(
+                    bill.customer_id,
+                    bill.customer_name,
+                    bill.qty,
+                    f"{bill.opening:.2f}",
+                    f"{bill.amount:.2f}",
+                    f"{bill.paid:.2f}",
+                    f"{bill.due:.2f}",
+                ),
+            )
+        totals = billing.billing_totals(bills)
+        self.billing_status_var.set(
+            f"{totals['customers']} customers, charges {totals['amount']:.2f}, "
+            f"due {totals['due']:.2f}"
+        )
+
+    def _export_billing(self):
+        if not self._billing_bills:
+            messagebox.showerror("Validation", "Run billing for a month first.")
+            return
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".csv",
+            filetypes=[("CSV files", "*.csv")],
+            initialfile=f"bills-{self._billing_month_value}.csv",
+            title="Export Bills",
+        )
+        if not file_path:
+            return
+        with open(file_path, "w", newline="", encoding="utf-8") as handle:
+            billing.write_bills(handle, self._billing_bills)
+        messagebox.showinfo("Done", f"Bills saved: {file_path}")
+
+    def _generate_billing_receipts(self):
+        month = self._get_month_value(self.billing_month)
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".zip",
+            filetypes=[("ZIP files", "*.zip")],
+            initialfile=f"receipts-{month}.zip",
+            title="Save Receipts",
+        )
+        if not file_path:
+            return
+        start_date, end_date = month_dates(month)
+
+        # Rendering runs on a worker thread; Tk is only touched from the main
+        # loop, which polls the worker's updates with after().
+        updates = queue.Queue()
+        self._billing_receipts_cancel = threading.Event()
+
+        def work():
+            try:
+                result = generate_batch_receipts(
+                    file_path,
+                    self.shop_name,
+                    self.shop_address,
+                    self.shop_contact,
+                    start_date,
+                    end_date,
+                    progress=lambda result: updates.put(("progress", dict(result))),
+                    cancel=self._billing_receipts_cancel,
+                )
+            except Exception as exc:
+                updates.put(("error", exc))
+            else:
+                updates.put(("done", result))
+
+        self.billing_receipts_button.config(state="disabled")
+        self.billing_cancel_button.config(state="normal")
+        self.billing_status_var.set("Receipts: starting...")
+        threading.Thread(target=work, daemon=True).start()
+        self.after(100, self._poll_billing_receipts, updates, file_path)
+
+    def _poll_billing_receipts(self, updates, file_path):
+        while True:
+            try:
+                kind, value = updates.get_nowait()
+            except queue.Empty:
+                self.after(100, self._poll_billing_receipts, updates, file_path)
+                return
+            if kind == "progress":
+                self.billing_status_var.set(
+                    f"Receipts: {value['rendered'] + value['skipped']}/{value['customers']}"
+                )
+                continue
+            break
+        self.billing_receipts_button.config(state="normal")
+        self.billing_cancel_button.config(state="disabled")
+        if kind == "error":
+            self.billing_status_var.set("Receipts failed.")
+            messagebox.showerror("Receipts", str(value))
+        elif value["cancelled"]:
+            self.billing_status_var.set("Receipts cancelled.")
+            messagebox.showinfo(
+                "Cancelled",
+                f"{value['rendered']} receipts rendered. Run again to finish {file_path}.",
+            )
+        else:
+            self.billing_status_var.set(f"Receipts: {value['customers']} done.")
+            messagebox.showinfo("Done", f"{value['rendered']} receipts written to {file_path}")
+
+    def _cancel_billing_receipts(self):
+        self.billing_status_var.set("Receipts: cancelling...")
+        self._billing_receipts_cancel.set()
+
     def _load_customer_summary(self):
         customer_id = self._get_combo_id(self.report_customer)
         start_date = self.report_from_date_var.get().strip()
@@ -1657,19 +2158,18 @@ class MilkBillingApp(tk.Tk):
             messagebox.showerror("Validation", "Customer and date range are required.")
             return
 
-        total_qty, total_amount, total_paid = db.customer_summary_range(
-            customer_id, start_date, end_date
-        )
-        balance = total_amount - total_paid
-        dues = balance if balance > 0 else 0.0
-        credit = -balance if balance < 0 else 0.0
+        summary = db.customer_summary_range(customer_id, start_date, end_date)
+        dues = summary.closing if summary.closing > 0 else 0.0
+        credit = -summary.closing if summary.closing < 0 else 0.0
         customer = db.get_customer(customer_id)
         lines = [
             f"Customer: {customer['name']}",
             f"Date Range: {start_date} to {end_date}",
-            f"Total Qty: {total_qty}",
-            f"Total Amount: {total_amount:.2f}",
-            f"Total Paid: {total_paid:.2f}",
+            f"Total Qty: {summary.total_qty}",
+            f"Opening Balance: {summary.opening:.2f}",
+            f"Period Charges: {summary.charges:.2f}",
+            f"Period Payments: {summary.paid:.2f}",
+            f"Closing Balance: {summary.closing:.2f}",
             f"Dues: {dues:.2f}    Credit: {credit:.2f}",
         ]
         self.customer_summary_box.delete("1.0", tk.END)
@@ -1812,6 +2312,66 @@ class MilkBillingApp(tk.Tk):
         password_entry.focus_set()
         self.wait_window(dialog)
 
+    def _show_db_stats(self):
+        dialog = tk.Toplevel(self)
+        dialog.title("Database Stats")
+        dialog.geometry("820x520")
+        dialog.transient(self)
+
+        controls = ttk.Frame(dialog)
+        controls.pack(fill="x", padx=10, pady=(8, 4))
+        enabled_var = tk.BooleanVar(value=db.instrumentation_enabled())
+        slow_var = tk.StringVar(value=str(db.slow_query_threshold()))
+
+        columns = ("function", "calls", "total_ms", "avg_ms", "p95_ms", "rows")
+        stats_list = ttk.Treeview(dialog, columns=columns, show="headings", height=12)
+        for column in columns:
+            stats_list.heading(column, text=column)
+            stats_list.column(column, width=90, anchor="e")
+        stats_list.column("function", width=260, anchor="w")
+        stats_list.pack(fill="both", expand=True, padx=10, pady=4)
+        slow_text = tk.Text(dialog, height=10, wrap="word")
+        slow_text.pack(fill="both", expand=True, padx=10, pady=(4, 10))
+
+        def refresh():
+            stats_list.delete(*stats_list.get_children())
+            for row in db.instrumentation_stats():
+                stats_list.insert("", "end", values=[row[column] for column in columns])
+            slow_text.delete("1.0", tk.END)
+            for entry in db.slow_queries():
+                lines = [f"{entry['at']}  {entry['function']}  {entry['ms']} ms", entry["sql"]]
+                lines.extend(f"    {step}" for step in entry["plan"])
+                slow_text.insert(tk.END, "\n".join(lines) + "\n\n")
+
+        def toggle():
+            if enabled_var.get():
+                try:
+                    slow_ms = float(slow_var.get())
+                except ValueError:
+                    messagebox.showerror("Invalid", "Slow query threshold must be a number.")
+                    enabled_var.set(False)
+                    return
+                db.enable_instrumentation(slow_ms)
+            else:
+                db.disable_instrumentation()
+
+        def reset():
+            db.reset_instrumentation()
+            refresh()
+
+        ttk.Checkbutton(
+            controls, text="Record query timings", variable=enabled_var, command=toggle
+        ).pack(side="left")
+        ttk.Label(controls, text="Slow query (ms)").pack(side="left", padx=(12, 4))
+        ttk.Entry(controls, textvariable=slow_var, width=8).pack(side="left")
+        ttk.Button(controls, text="Refresh", command=refresh, style="Secondary.TButton").pack(
+            side="right", padx=4
+        )
+        ttk.Button(controls, text="Reset", command=reset, style="Secondary.TButton").pack(
+            side="right", padx=4
+        )
+        refresh()
+
     def _get_month_days(self, year, month):
         _, days = calendar.monthrange(year, month)
         return [f"{d:02d}" for d in range(1, days + 1)]
@@ -1829,5 +2389,6 @@ class MilkBillingApp(tk.Tk):
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     app = MilkBillingApp()
     app.mainloop()
@@ -0,0 +1,76 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+
+ROWS = 100_000
+
+
+def seed(path):
+    db.set_db_path(path)
+    db.add_customer("Bench Customer", "", "", "")
+    db.add_item("Milk", 56)
+    db.add_delivery_partner("Bench Partner", "", "")
+    db.add_manager("Bench Manager", "")
+    db.add_daily_deliveries_bulk(
+        ("2024-01-%02d" % (n % 28 + 1), 1, 1, 1 + n % 3, 56, 1, 1)
+        for n in range(ROWS)
+    )
+
+
+def old_path():
+    with db.get_conn() as conn:
+        sql, params = db._build_query(db.DELIVERY_SELECT, [], [], "dd.id DESC")
+        rows = conn.execute(sql, params).fetchall()
+    dicts = [dict(r) for r in rows]
+    return [
+        {
+            "date": row["date"],
+            "customer": row["customer_name"],
+            "item": row["item_name"],
+            "qty": row["quantity"],
+            "partner": row["partner_name"],
+            "manager": row["manager_name"],
+        }
+        for row in dicts
+    ], rows, dicts
+
+
+def new_path():
+    return db.list_daily_deliveries_range()
+
+
+def measure(label, func):
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    print(f"{label:<28} {elapsed * 1000:9.1f} ms {peak / 1024 / 1024:9.1f} MiB peak")
+    return elapsed, peak
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        seed(os.path.join(tmp, "bench.db"))
+        print(f"{ROWS} delivery rows, SQLite {sqlite3.sqlite_version}")
+        new_path()
+        old = measure("sqlite3.Row + dict + display", old_path)
+        new = measure("Delivery records", new_path)
+        print(
+            f"records: {old[0] / new[0]:.1f}x faster, "
+            f"{old[1] / new[1]:.1f}x less peak memory"
+        )
+        db.close_pools()
+
+
+if __name__ == "__main__":
+    main()
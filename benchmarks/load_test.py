@@ -0,0 +1,102 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import db  # noqa: E402
+from seed_data import build_database  # noqa: E402
+
+
+def session(number, args, summary, latencies, errors, lock):
+    rng = random.Random(number)
+    # Each session writes its own customer on days after the seeded range, so
+    # no two writes share a delivery natural key even when it is enabled.
+    first_day = date.fromisoformat(summary["end_date"]) + timedelta(days=1)
+    customer_id = number % summary["customers"] + 1
+    for iteration in range(args.iterations):
+        day = (first_day + timedelta(days=iteration)).strftime("%Y-%m-%d")
+        partner_id = rng.randint(1, summary["partners"])
+        item_id = rng.randint(1, summary["items"])
+        started = time.perf_counter()
+        try:
+            if args.mode == "queued":
+                db.write(db.add_daily_delivery, day, customer_id, item_id, 1, 30, partner_id, 1)
+                if rng.random() < 0.2:
+                    db.write(db.add_advance_payment, customer_id, 100, day, "load test")
+            else:
+                db.add_daily_delivery(day, customer_id, item_id, 1, 30, partner_id, 1)
+                if rng.random() < 0.2:
+                    db.add_advance_payment(customer_id, 100, day, "load test")
+            elapsed = time.perf_counter() - started
+            db.list_daily_deliveries(day, page_size=50)
+            db.partner_remaining(partner_id, day)
+        except Exception as exc:
+            with lock:
+                errors[f"{type(exc).__name__}: {exc}"] += 1
+            continue
+        with lock:
+            latencies.append(elapsed * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent write load test for db.py.")
+    parser.add_argument("--mode", choices=("queued", "direct"), default="queued")
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--busy-timeout-ms", type=int, default=db.BUSY_TIMEOUT_MS)
+    args = parser.parse_args()
+
+    db.BUSY_TIMEOUT_MS = args.busy_timeout_ms
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        summary = build_database(os.path.join(tmp_dir, "load.db"), customers=200, days=7)
+        with db.get_conn() as conn:
+            before = conn.execute("SELECT COUNT(*) FROM daily_deliveries").fetchone()[0]
+        latencies = []
+        errors = Counter()
+        lock = threading.Lock()
+        threads = [
+            threading.Thread(target=session, args=(n, args, summary, latencies, errors, lock))
+            for n in range(args.sessions)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - started
+        with db.get_conn() as conn:
+            after = conn.execute("SELECT COUNT(*) FROM daily_deliveries").fetchone()[0]
+        mismatches = db.verify_customer_balances()
+        db.close_pools()
+
+    latencies.sort()
+    attempted = args.sessions * args.iterations
+    print(f"mode={args.mode} sessions={args.sessions} busy_timeout={args.busy_timeout_ms}ms")
+    print(
+        f"completed {len(latencies)}/{attempted} steps in {wall:.2f}s "
+        f"({len(latencies) / wall:.0f} steps/s)"
+    )
+    if latencies:
+        print(
+            f"write latency p50 {latencies[len(latencies) // 2]:.1f} ms, "
+            f"p95 {latencies[int(len(latencies) * 0.95) - 1]:.1f} ms, "
+            f"max {latencies[-1]:.1f} ms"
+        )
+    print(f"deliveries written {after - before}, balance mismatches {len(mismatches)}")
+    for message, count in errors.most_common():
+        print(f"  {count} x {message}")
+    if errors or mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
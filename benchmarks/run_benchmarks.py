@@ -0,0 +1,186 @@
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import db  # noqa: E402
+from seed_data import build_database  # noqa: E402
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BENCH_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def timed(func, repeat):
+    func()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        "repeat": repeat,
+        "min_ms": round(samples[0], 3),
+        "median_ms": round(statistics.median(samples), 3),
+        "mean_ms": round(statistics.fmean(samples), 3),
+        "p95_ms": round(samples[max(int(len(samples) * 0.95 + 0.5) - 1, 0)], 3),
+    }
+
+
+def receipt_case(tmp_dir, customer_id, start_date, end_date):
+    try:
+        from reports import generate_customer_receipt
+    except ImportError:
+        return None
+    customer = db.get_customer(customer_id)
+    settings = db.get_settings()
+    output_path = os.path.join(tmp_dir, "receipt.pdf")
+
+    def run():
+        deliveries, payments = db.customer_statement_range(customer_id, start_date, end_date)
+        generate_customer_receipt(
+            output_path,
+            settings.get("shop_name", "Milk Billing System"),
+            settings.get("shop_address", ""),
+            settings.get("shop_contact", ""),
+            customer,
+            f"{start_date} to {end_date}",
+            deliveries,
+            payments,
+        )
+
+    return run
+
+
+def build_cases(summary, tmp_dir):
+    end_date = summary["end_date"]
+    month_start = end_date[:8] + "01"
+    customer_id = summary["customers"] // 2 or 1
+    cases = {
+        "list_customers_with_balance": lambda: db.list_customers_with_balance(""),
+        "list_customers_with_balance_search": lambda: db.list_customers_with_balance("Route 3"),
+        "list_daily_deliveries_day": lambda: db.list_daily_deliveries(end_date),
+        "list_daily_deliveries_page": lambda: db.list_daily_deliveries(page_size=200),
+        "partner_remaining": lambda: db.partner_remaining(1, end_date),
+        "customer_statement_range": lambda: db.customer_statement_range(
+            customer_id, summary["start_date"], end_date
+        ),
+        "monthly_customer_statement": lambda: db.monthly_customer_statement(
+            customer_id, end_date[:7]
+        ),
+        "month_end_billing": lambda: db.month_end_billing(end_date[:7]),
+    }
+    skipped = []
+    receipt = receipt_case(tmp_dir, customer_id, month_start, end_date)
+    if receipt is None:
+        skipped.append("generate_customer_receipt")
+    else:
+        cases["generate_customer_receipt"] = receipt
+    return cases, skipped
+
+
+def compare(results, baseline_path, threshold):
+    with open(baseline_path, encoding="utf-8") as handle:
+        baseline = json.load(handle)["results"]
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        change = (current["median_ms"] - previous["median_ms"]) / previous["median_ms"] * 100
+        flag = "REGRESSION" if change > threshold else ""
+        print(
+            f"{name:<36} {previous['median_ms']:10.3f} -> {current['median_ms']:10.3f} ms "
+            f"{change:+7.1f}% {flag}"
+        )
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the hot db.py and reports.py entry points.")
+    parser.add_argument("--db", help="Reuse this database instead of building a synthetic one.")
+    parser.add_argument("--customers", type=int, default=500)
+    parser.add_argument("--partners", type=int, default=10)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="Earlier results file to compare medians against.")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=10.0,
+        help="Percent slowdown in median reported as a regression.",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.db:
+            db.set_db_path(args.db)
+            with db.get_conn() as conn:
+                bounds = conn.execute(
+                    "SELECT MIN(date), MAX(date) FROM daily_deliveries"
+                ).fetchone()
+                count = conn.execute("SELECT COUNT(*) FROM customers").fetchone()[0]
+            summary = {"start_date": bounds[0], "end_date": bounds[1], "customers": count}
+        else:
+            summary = build_database(
+                os.path.join(tmp_dir, "bench.db"),
+                customers=args.customers,
+                partners=args.partners,
+                days=args.days,
+            )
+        results = {}
+        cases, skipped = build_cases(summary, tmp_dir)
+        for name in skipped:
+            print(f"{name:<36} skipped (reportlab not installed)")
+        for name, func in cases.items():
+            results[name] = timed(func, args.repeat)
+            print(
+                f"{name:<36} median {results[name]['median_ms']:10.3f} ms  "
+                f"p95 {results[name]['p95_ms']:10.3f} ms"
+            )
+        db.close_pools()
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "dataset": summary,
+            "skipped": skipped,
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as handle:
+        json.dump(report, handle, indent=2)
+    print(f"Results written to {args.output}")
+    if args.baseline and compare(results, args.baseline, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import argparse
+import os
+import random
+import sys
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+
+ITEMS = (
+    ("Full Cream Milk 500ml", 34),
+    ("Toned Milk 500ml", 28),
+    ("Double Toned Milk 500ml", 25),
+    ("Buffalo Milk 1L", 72),
+    ("Curd 400g", 35),
+    ("Buttermilk 500ml", 15),
+    ("Paneer 200g", 90),
+    ("Ghee 500ml", 320),
+)
+
+
+def build_database(
+    path,
+    customers=500,
+    partners=10,
+    items=5,
+    managers=3,
+    days=90,
+    end_date=None,
+    seed=1,
+):
+    if os.path.exists(path):
+        os.remove(path)
+    rng = random.Random(seed)
+    db.set_db_path(path)
+    end_date = end_date or date.today()
+    dates = [
+        (end_date - timedelta(days=offset)).strftime("%Y-%m-%d")
+        for offset in range(days - 1, -1, -1)
+    ]
+    items = max(1, min(items, len(ITEMS)))
+    with db.get_conn() as conn:
+        conn.executemany(
+            "INSERT INTO delivery_partners (name, contact, address) VALUES (?, ?, ?)",
+            [(f"Partner {n}", f"90000{n:05d}", f"Route {n}") for n in range(1, partners + 1)],
+        )
+        conn.executemany(
+            "INSERT INTO managers (name, contact) VALUES (?, ?)",
+            [(f"Manager {n}", f"80000{n:05d}") for n in range(1, managers + 1)],
+        )
+        conn.executemany(
+            "INSERT INTO items (name, price_paise) VALUES (?, ?)",
+            [(name, db.to_paise(price)) for name, price in ITEMS[:items]],
+        )
+        conn.executemany(
+            "INSERT INTO customers (name, contact, address) VALUES (?, ?, ?)",
+            [
+                (f"Customer {n}", f"70000{n:05d}", f"House {n}, Route {n % partners + 1}")
+                for n in range(1, customers + 1)
+            ],
+        )
+
+    routines = []
+    for customer_id in range(1, customers + 1):
+        partner_id = (customer_id - 1) % partners + 1
+        picks = rng.sample(range(1, items + 1), k=rng.choice((1, 1, 2)))
+        routines.append(
+            (customer_id, partner_id, [(item_id, rng.choice((1, 1, 2, 3))) for item_id in picks])
+        )
+
+    deliveries = []
+    allocations = {}
+    for day in dates:
+        manager_id = rng.randint(1, managers)
+        for customer_id, partner_id, picks in routines:
+            if rng.random() < 0.05:
+                continue
+            for item_id, quantity in picks:
+                price = ITEMS[item_id - 1][1]
+                deliveries.append(
+                    (day, customer_id, item_id, quantity, price, partner_id, manager_id)
+                )
+                key = (day, partner_id, item_id)
+                allocations[key] = allocations.get(key, 0) + quantity
+    db.add_daily_deliveries_bulk(deliveries)
+
+    payments = []
+    for customer_id in range(1, customers + 1):
+        for day in dates[rng.randint(0, 14)::rng.choice((15, 30))]:
+            amount_paise = rng.choice((500, 1000, 1500, 2000)) * 100
+            payments.append((customer_id, amount_paise, day, "seed"))
+    with db.get_conn() as conn:
+        conn.executemany(
+            """
+            INSERT INTO advance_payments (customer_id, amount_paise, date, notes)
+            VALUES (?, ?, ?, ?)
+            """,
+            payments,
+        )
+        conn.executemany(
+            """
+            INSERT INTO partner_allocations (date, delivery_partner_id, manager_id, item_id, quantity)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            [
+                (day, partner_id, rng.randint(1, managers), item_id, quantity + rng.randint(0, 3))
+                for (day, partner_id, item_id), quantity in allocations.items()
+            ],
+        )
+    with db.get_conn() as conn:
+        conn.execute("ANALYZE")
+    return {
+        "customers": customers,
+        "partners": partners,
+        "items": items,
+        "managers": managers,
+        "days": days,
+        "start_date": dates[0],
+        "end_date": dates[-1],
+        "deliveries": len(deliveries),
+        "payments": len(payments),
+        "allocations": len(allocations),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a synthetic milk billing database.")
+    parser.add_argument("path", nargs="?", default="bench.db")
+    parser.add_argument("--customers", type=int, default=500)
+    parser.add_argument("--partners", type=int, default=10)
+    parser.add_argument("--items", type=int, default=5)
+    parser.add_argument("--managers", type=int, default=3)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    summary = build_database(
+        args.path,
+        customers=args.customers,
+        partners=args.partners,
+        items=args.items,
+        managers=args.managers,
+        days=args.days,
+        seed=args.seed,
+    )
+    db.close_pools()
+    for key, value in summary.items():
+        print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
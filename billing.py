@@ -0,0 +1,74 @@
+import argparse
+import csv
+import sys
+import time
+
+import db
+
+BILL_COLUMNS = ("customer_id", "customer_name", "qty", "opening", "amount", "paid", "due")
+LINE_COLUMNS = ("customer_id", "customer_name", "item_name", "qty", "amount")
+
+
+def write_bills(handle, bills):
+    writer = csv.writer(handle)
+    writer.writerow(BILL_COLUMNS)
+    for bill in bills:
+        writer.writerow([bill[column] for column in BILL_COLUMNS])
+
+
+def write_bill_lines(handle, lines):
+    writer = csv.writer(handle)
+    writer.writerow(LINE_COLUMNS)
+    for line in lines:
+        writer.writerow([line[column] for column in LINE_COLUMNS])
+
+
+def billing_totals(bills):
+    totals = {"customers": len(bills), "qty": 0, "amount": 0, "paid": 0, "due": 0}
+    for bill in bills:
+        totals["qty"] += bill.qty
+        totals["amount"] += db.to_paise(bill.amount)
+        totals["paid"] += db.to_paise(bill.paid)
+        totals["due"] += db.to_paise(bill.due) if bill.due > 0 else 0
+    for key in ("amount", "paid", "due"):
+        totals[key] = db.from_paise(totals[key])
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bill every customer for a month.")
+    parser.add_argument("month", help="Month to bill, as YYYY-MM.")
+    parser.add_argument("--db", default=db.DB_FILE, help="Database file to read.")
+    parser.add_argument("--output", help="Bill CSV path (default: bills-<month>.csv).")
+    parser.add_argument("--lines", help="Also write per-item bill lines to this CSV.")
+    args = parser.parse_args()
+
+    try:
+        db.month_range(args.month)
+    except ValueError:
+        parser.error(f"invalid month {args.month!r}, expected YYYY-MM")
+    db.set_db_path(args.db)
+    started = time.perf_counter()
+    bills, lines = db.month_end_billing(args.month)
+    elapsed = time.perf_counter() - started
+
+    output = args.output or f"bills-{args.month}.csv"
+    with open(output, "w", newline="", encoding="utf-8") as handle:
+        write_bills(handle, bills)
+    if args.lines:
+        with open(args.lines, "w", newline="", encoding="utf-8") as handle:
+            write_bill_lines(handle, lines)
+    totals = billing_totals(bills)
+    print(
+        f"Billed {totals['customers']} customers for {args.month} in {elapsed:.2f}s: "
+        f"qty {totals['qty']}, charges {totals['amount']:.2f}, "
+        f"paid {totals['paid']:.2f}, due {totals['due']:.2f}",
+        file=sys.stderr,
+    )
+    print(f"Bills written to {output}", file=sys.stderr)
+    db.close_pools()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,122 +1,1049 @@
+import csv
+import functools
+import inspect
+import json
+import logging
+import math
+import os
+import queue
 import sqlite3
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import Future
 from contextlib import contextmanager
 from datetime import date
+from decimal import ROUND_HALF_UP, Decimal
 
 
 DB_FILE = "milk_billing.db"
+MEMORY_DB_URI = "file:milk_billing_memory?mode=memory&cache=shared"
+POOL_SIZE = 8
+POOL_TIMEOUT = 30.0
+BUSY_TIMEOUT_MS = int(os.environ.get("MILK_DB_BUSY_TIMEOUT_MS", "5000"))
+WRITE_QUEUE_SIZE = 256
+WRITE_BATCH_SIZE = 64
+WRITE_BATCH_WINDOW = 0.005
+WRITE_RETRIES = 5
+WRITE_RETRY_DELAY = 0.05
+ITER_CHUNK_SIZE = 500
+SLOW_QUERY_MS = 100.0
+STATS_SAMPLE_SIZE = 1000
+SLOW_QUERY_LOG_SIZE = 100
+
+logger = logging.getLogger(__name__)
+
+INDEXES = (
+    ("idx_daily_deliveries_date", "daily_deliveries", ("date",)),
+    ("idx_daily_deliveries_customer_date", "daily_deliveries", ("customer_id", "date")),
+    (
+        "idx_daily_deliveries_partner_date",
+        "daily_deliveries",
+        ("delivery_partner_id", "date"),
+    ),
+    ("idx_advance_payments_date", "advance_payments", ("date",)),
+    ("idx_advance_payments_customer_date", "advance_payments", ("customer_id", "date")),
+    ("idx_partner_allocations_date", "partner_allocations", ("date",)),
+    (
+        "idx_partner_allocations_partner_date",
+        "partner_allocations",
+        ("delivery_partner_id", "date"),
+    ),
+)
+
+BALANCE_TRIGGERS = (
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_daily_deliveries_balance_insert
+    AFTER INSERT ON daily_deliveries
+    BEGIN
+        INSERT INTO customer_balances (customer_id, charges_paise)
+        VALUES (NEW.customer_id, NEW.quantity * NEW.price_paise)
+        ON CONFLICT(customer_id) DO UPDATE SET charges_paise = charges_paise + excluded.charges_paise;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_daily_deliveries_balance_update
+    AFTER UPDATE OF customer_id, quantity, price_paise ON daily_deliveries
+    BEGIN
+        UPDATE customer_balances
+        SET charges_paise = charges_paise - OLD.quantity * OLD.price_paise
+        WHERE customer_id = OLD.customer_id;
+        INSERT INTO customer_balances (customer_id, charges_paise)
+        VALUES (NEW.customer_id, NEW.quantity * NEW.price_paise)
+        ON CONFLICT(customer_id) DO UPDATE SET charges_paise = charges_paise + excluded.charges_paise;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_daily_deliveries_balance_delete
+    AFTER DELETE ON daily_deliveries
+    BEGIN
+        UPDATE customer_balances
+        SET charges_paise = charges_paise - OLD.quantity * OLD.price_paise
+        WHERE customer_id = OLD.customer_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_advance_payments_balance_insert
+    AFTER INSERT ON advance_payments
+    BEGIN
+        INSERT INTO customer_balances (customer_id, paid_paise)
+        VALUES (NEW.customer_id, NEW.amount_paise)
+        ON CONFLICT(customer_id) DO UPDATE SET paid_paise = paid_paise + excluded.paid_paise;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_advance_payments_balance_update
+    AFTER UPDATE OF customer_id, amount_paise ON advance_payments
+    BEGIN
+        UPDATE customer_balances
+        SET paid_paise = paid_paise - OLD.amount_paise
+        WHERE customer_id = OLD.customer_id;
+        INSERT INTO customer_balances (customer_id, paid_paise)
+        VALUES (NEW.customer_id, NEW.amount_paise)
+        ON CONFLICT(customer_id) DO UPDATE SET paid_paise = paid_paise + excluded.paid_paise;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_advance_payments_balance_delete
+    AFTER DELETE ON advance_payments
+    BEGIN
+        UPDATE customer_balances
+        SET paid_paise = paid_paise - OLD.amount_paise
+        WHERE customer_id = OLD.customer_id;
+    END
+    """,
+)
+
+# customer_ledger_months keeps, per customer and month, that month's totals and
+# the running totals up to and including it, so an opening balance is a single
+# index lookup plus at most one month of rows. Writes touch the entry's month
+# and the (usually few) months after it. The month row is opened with NOT EXISTS
+# rather than INSERT OR IGNORE: an outer upsert overrides the trigger's conflict
+# clause, which would turn an existing month into a constraint error.
+LEDGER_MONTH_OPEN = """
+        INSERT INTO customer_ledger_months
+            (customer_id, month, cum_charges_paise, cum_paid_paise)
+        SELECT
+            NEW.customer_id,
+            substr(NEW.date, 1, 7),
+            COALESCE((
+                SELECT cum_charges_paise FROM customer_ledger_months
+                WHERE customer_id = NEW.customer_id AND month < substr(NEW.date, 1, 7)
+                ORDER BY month DESC LIMIT 1
+            ), 0),
+            COALESCE((
+                SELECT cum_paid_paise FROM customer_ledger_months
+                WHERE customer_id = NEW.customer_id AND month < substr(NEW.date, 1, 7)
+                ORDER BY month DESC LIMIT 1
+            ), 0)
+        WHERE NOT EXISTS (
+            SELECT 1 FROM customer_ledger_months
+            WHERE customer_id = NEW.customer_id AND month = substr(NEW.date, 1, 7)
+        );"""
+
+LEDGER_MONTH_APPLY = """
+        UPDATE customer_ledger_months
+        SET {column} = {column}
+                + CASE WHEN month = substr({row}.date, 1, 7) THEN {sign}({amount}) ELSE 0 END,
+            cum_{column} = cum_{column} + {sign}({amount})
+        WHERE customer_id = {row}.customer_id AND month >= substr({row}.date, 1, 7);"""
+
+
+def _ledger_month_triggers():
+    triggers = []
+    sources = (
+        (
+            "daily_deliveries",
+            "charges_paise",
+            "{row}.quantity * {row}.price_paise",
+            "customer_id, date, quantity, price_paise",
+        ),
+        ("advance_payments", "paid_paise", "{row}.amount_paise", "customer_id, date, amount_paise"),
+    )
+    for table_name, column, amount, watched in sources:
+        add = LEDGER_MONTH_OPEN + LEDGER_MONTH_APPLY.format(
+            column=column, row="NEW", sign="", amount=amount.format(row="NEW")
+        )
+        remove = LEDGER_MONTH_APPLY.format(
+            column=column, row="OLD", sign="-", amount=amount.format(row="OLD")
+        )
+        for event, body in (
+            ("INSERT", add),
+            (f"UPDATE OF {watched}", remove + add),
+            ("DELETE", remove),
+        ):
+            name = f"trg_{table_name}_ledger_month_{event.split()[0].lower()}"
+            triggers.append(
+                f"CREATE TRIGGER IF NOT EXISTS {name}\n"
+                f"    AFTER {event} ON {table_name}\n"
+                f"    BEGIN{body}\n    END"
+            )
+    return tuple(triggers)
+
+
+LEDGER_MONTH_TRIGGERS = _ledger_month_triggers()
+
+
+class ConnectionPool:
+    def __init__(self, path, max_size=POOL_SIZE):
+        self.path = path
+        self.max_size = max_size
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._closed = False
+        self._watch_conn = None
+        self._watch_lock = threading.Lock()
+        self._writer = None
+
+    def _open(self, **kwargs):
+        # Every ":memory:" connection would get its own empty database, so the
+        # pool opens one named shared-cache database instead.
+        if self.path == ":memory:":
+            return sqlite3.connect(MEMORY_DB_URI, uri=True, check_same_thread=False, **kwargs)
+        return sqlite3.connect(self.path, check_same_thread=False, **kwargs)
+
+    def _connect(self, **kwargs):
+        conn = self._open(timeout=BUSY_TIMEOUT_MS / 1000, **kwargs)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def acquire(self, timeout=POOL_TIMEOUT):
+        if not self._slots.acquire(timeout=timeout):
+            raise sqlite3.OperationalError(
+                f"No free database connection for {self.path} after {timeout}s"
+            )
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        try:
+            return self._connect()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn):
+        with self._lock:
+            keep = not self._closed and not conn.in_transaction
+            if keep:
+                self._idle.append(conn)
+        if not keep:
+            conn.close()
+        self._slots.release()
+
+    def _watch(self):
+        if self._watch_conn is None:
+            self._watch_conn = self._open()
+        return self._watch_conn
+
+    def data_version(self):
+        with self._watch_lock:
+            return self._watch().execute("PRAGMA data_version").fetchone()[0]
+
+    def explain(self, sql):
+        with self._watch_lock:
+            rows = self._watch().execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+        return [row[3] for row in rows]
+
+    def writer(self):
+        with self._lock:
+            if self._closed:
+                raise sqlite3.ProgrammingError(f"Connection pool for {self.path} is closed")
+            if self._writer is None or not self._writer.alive():
+                self._writer = WriteQueue(self)
+            return self._writer
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            writer.close()
+        for conn in idle:
+            conn.close()
+        with self._watch_lock:
+            if self._watch_conn is not None:
+                self._watch_conn.close()
+                self._watch_conn = None
+
+
+_writer_local = threading.local()
+
+
+def _is_busy(exc):
+    message = str(exc).lower()
+    return isinstance(exc, sqlite3.OperationalError) and (
+        "locked" in message or "busy" in message
+    )
+
+
+class WriteQueue:
+    # One writer thread per database. Writes that arrive within
+    # WRITE_BATCH_WINDOW of each other share a transaction, each in its own
+    # savepoint so one failing write does not undo the rest of the batch.
+    def __init__(self, pool):
+        self.pool = pool
+        self._queue = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+        self._conn = None
+        self._error = None
+        self._thread = threading.Thread(
+            target=self._run, name=f"db-writer:{os.path.basename(pool.path)}", daemon=True
+        )
+        self._thread.start()
+
+    def alive(self):
+        return self._thread.is_alive()
+
+    def submit(self, func, *args, **kwargs):
+        if not self.alive():
+            raise self._stopped_error()
+        future = Future()
+        try:
+            self._queue.put((func, args, kwargs, future), timeout=POOL_TIMEOUT)
+        except queue.Full:
+            raise sqlite3.OperationalError(
+                f"Write queue for {self.pool.path} is full after {POOL_TIMEOUT}s"
+            ) from None
+        # The writer may have stopped after the check above; nothing would
+        # ever pick this write up, so fail it rather than leave callers waiting.
+        if not self.alive():
+            self._fail_pending()
+        return future
+
+    def _stopped_error(self):
+        error = sqlite3.OperationalError(f"Write queue for {self.pool.path} has stopped")
+        error.__cause__ = self._error
+        return error
+
+    def _fail_pending(self):
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if item is not None:
+                item[3].set_exception(self._stopped_error())
+
+    def close(self):
+        try:
+            self._queue.put(None, timeout=POOL_TIMEOUT)
+        except queue.Full:
+            logger.warning("Write queue for %s did not drain; not waiting for it", self.pool.path)
+            return
+        self._thread.join(POOL_TIMEOUT)
+
+    def _next_batch(self):
+        first = self._queue.get()
+        if first is None:
+            return None, True
+        batch = [first]
+        deadline = time.monotonic() + WRITE_BATCH_WINDOW
+        while len(batch) < WRITE_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        _db_local.path = self.pool.path
+        batch = []
+        try:
+            self._conn = self.pool._connect(isolation_level=None)
+            while True:
+                batch, stop = self._next_batch()
+                batch = [item for item in batch or () if item[3].set_running_or_notify_cancel()]
+                if batch:
+                    self._run_batch(batch)
+                batch = []
+                if stop:
+                    break
+        except Exception as exc:
+            self._error = exc
+            logger.exception("Write queue for %s stopped", self.pool.path)
+            for *_, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+        finally:
+            if self._conn is not None:
+                self._conn.close()
+            self._fail_pending()
+
+    def _run_batch(self, batch):
+        for attempt in range(WRITE_RETRIES + 1):
+            try:
+                outcomes = self._apply(batch)
+            except Exception as exc:
+                if _is_busy(exc) and attempt < WRITE_RETRIES:
+                    time.sleep(WRITE_RETRY_DELAY * 2**attempt)
+                    continue
+                for *_, future in batch:
+                    future.set_exception(exc)
+                return
+            for (*_, future), (ok, value) in zip(batch, outcomes):
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+            return
+
+    def _apply(self, batch):
+        if not _instrumented:
+            self._conn.set_trace_callback(None)
+            return self._apply_batch(batch)
+        # Queued functions record their own statements; the batch frame picks
+        # up the transaction control statements, including slow COMMITs.
+        self._conn.set_trace_callback(_trace_sql)
+        frames = _trace_state.__dict__.setdefault("frames", [])
+        statements = []
+        frames.append(statements)
+        started = time.perf_counter()
+        try:
+            return self._apply_batch(batch)
+        finally:
+            finished = time.perf_counter()
+            frames.pop()
+            _record_call("write_queue.batch", finished - started, len(batch), statements, finished)
+
+    def _apply_batch(self, batch):
+        conn = self._conn
+        outcomes = []
+        committed_callbacks = []
+        _writer_local.conn = conn
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for func, args, kwargs, _ in batch:
+                conn.execute("SAVEPOINT queued_write")
+                _writer_local.after_commit = []
+                try:
+                    outcomes.append((True, func(*args, **kwargs)))
+                    committed_callbacks.extend(_writer_local.after_commit)
+                except Exception as exc:
+                    if _is_busy(exc):
+                        raise
+                    conn.execute("ROLLBACK TO queued_write")
+                    outcomes.append((False, exc))
+                conn.execute("RELEASE queued_write")
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            _writer_local.conn = None
+            _writer_local.after_commit = None
+        for callback in committed_callbacks:
+            callback()
+        return outcomes
+
+
+def _after_commit(callback):
+    # Inside a queued write the batch has not committed yet, so defer until it
+    # has; anywhere else get_conn() has already committed.
+    pending = getattr(_writer_local, "after_commit", None)
+    if pending is not None:
+        pending.append(callback)
+    else:
+        callback()
+
+
+def submit_write(func, *args, **kwargs):
+    return get_pool().writer().submit(func, *args, **kwargs)
+
+
+def write(func, *args, **kwargs):
+    if getattr(_writer_local, "conn", None) is not None:
+        return func(*args, **kwargs)
+    return submit_write(func, *args, **kwargs).result()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+_db_local = threading.local()
+
+
+def _pool_key(path):
+    if path == ":memory:":
+        return path
+    return os.path.abspath(path)
+
+
+def current_db_path():
+    return getattr(_db_local, "path", None) or DB_FILE
+
+
+def get_pool(path=None):
+    key = _pool_key(path or current_db_path())
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ConnectionPool(key)
+            _pools[key] = pool
+        return pool
+
+
+def _close_pool_keys(keys):
+    with _pools_lock:
+        pools = [_pools.pop(key) for key in keys if key in _pools]
+    for pool in pools:
+        pool.close()
+        # A replaced file can restart PRAGMA data_version at the value the
+        # caches were stamped with, so drop everything cached for the path.
+        _migrated.pop(pool.path, None)
+        with _settings_lock:
+            _settings_cache.pop(pool.path, None)
+        with _master_lock:
+            for cache_key in [key for key in _master_cache if key[0] == pool.path]:
+                del _master_cache[cache_key]
+
+
+def close_pool(path):
+    _close_pool_keys([_pool_key(path)])
+
+
+def close_pools():
+    with _pools_lock:
+        keys = list(_pools)
+    _close_pool_keys(keys)
+
+
+def set_db_path(path):
+    global DB_FILE
+    old = DB_FILE
+    if _pool_key(path) == _pool_key(old) and _pool_key(path) in _migrated:
+        return
+    DB_FILE = path
+    if _pool_key(path) != _pool_key(old):
+        close_pool(old)
+    init_db()
+
+
+def use_db_path(path):
+    # Per-thread override of DB_FILE, for servers where each session thread
+    # may point at a different database. Other databases' pools stay open.
+    _db_local.path = path
+    init_db()
 
 
 @contextmanager
 def get_conn():
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
+    writer_conn = getattr(_writer_local, "conn", None)
+    if writer_conn is not None:
+        yield writer_conn
+        return
+    pool = get_pool()
+    conn = pool.acquire()
+    conn.set_trace_callback(_trace_sql if _instrumented else None)
     try:
         yield conn
         conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
     finally:
-        conn.close()
+        pool.release(conn)
+
+
+_migrated = {}
+
+
+def _file_stamp(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
 
 
 def init_db():
+    path = _pool_key(current_db_path())
+    stamp = _file_stamp(path)
+    if stamp is not None and _migrated.get(path) == stamp:
+        return
     with get_conn() as conn:
-        cur = conn.cursor()
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS customers (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                contact TEXT,
-                address TEXT,
-                alt_delivery_partner_id INTEGER,
-                alt_contact TEXT,
-                active INTEGER NOT NULL DEFAULT 1,
-                FOREIGN KEY (alt_delivery_partner_id) REFERENCES delivery_partners (id)
-            )
-            """
+        if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            conn.execute("BEGIN IMMEDIATE")
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            cur = conn.cursor()
+            for number, migration in enumerate(SCHEMA_MIGRATIONS[version:], version + 1):
+                migration(cur)
+                cur.execute(f"PRAGMA user_version = {number}")
+    _migrated[path] = _file_stamp(path)
+
+
+def _create_base_schema(cursor):
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS customers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            contact TEXT,
+            address TEXT,
+            alt_delivery_partner_id INTEGER,
+            alt_contact TEXT,
+            active INTEGER NOT NULL DEFAULT 1,
+            FOREIGN KEY (alt_delivery_partner_id) REFERENCES delivery_partners (id)
         )
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS delivery_partners (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                contact TEXT,
-                address TEXT,
-                active INTEGER NOT NULL DEFAULT 1
-            )
-            """
+        """
+    )
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS delivery_partners (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            contact TEXT,
+            address TEXT,
+            active INTEGER NOT NULL DEFAULT 1
         )
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS items (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                price REAL NOT NULL
-            )
-            """
+        """
+    )
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            price_paise INTEGER NOT NULL
         )
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS managers (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                contact TEXT
-            )
-            """
+        """
+    )
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS managers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            contact TEXT
         )
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS advance_payments (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                customer_id INTEGER NOT NULL,
-                amount REAL NOT NULL,
-                date TEXT NOT NULL,
-                notes TEXT,
-                FOREIGN KEY (customer_id) REFERENCES customers (id)
-            )
-            """
+        """
+    )
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS advance_payments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            customer_id INTEGER NOT NULL,
+            amount_paise INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            notes TEXT,
+            FOREIGN KEY (customer_id) REFERENCES customers (id)
         )
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS daily_deliveries (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                date TEXT NOT NULL,
-                customer_id INTEGER NOT NULL,
-                item_id INTEGER NOT NULL,
-                quantity INTEGER NOT NULL,
-                price REAL NOT NULL,
-                delivery_partner_id INTEGER NOT NULL,
-                manager_id INTEGER NOT NULL,
-                FOREIGN KEY (customer_id) REFERENCES customers (id),
-                FOREIGN KEY (item_id) REFERENCES items (id),
-                FOREIGN KEY (delivery_partner_id) REFERENCES delivery_partners (id),
-                FOREIGN KEY (manager_id) REFERENCES managers (id)
+        """
+    )
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS daily_deliveries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT NOT NULL,
+            customer_id INTEGER NOT NULL,
+            item_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            price_paise INTEGER NOT NULL,
+            delivery_partner_id INTEGER NOT NULL,
+            manager_id INTEGER NOT NULL,
+            FOREIGN KEY (customer_id) REFERENCES customers (id),
+            FOREIGN KEY (item_id) REFERENCES items (id),
+            FOREIGN KEY (delivery_partner_id) REFERENCES delivery_partners (id),
+            FOREIGN KEY (manager_id) REFERENCES managers (id)
+        )
+        """
+    )
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS partner_allocations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT NOT NULL,
+            delivery_partner_id INTEGER NOT NULL,
+            manager_id INTEGER NOT NULL,
+            item_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            FOREIGN KEY (delivery_partner_id) REFERENCES delivery_partners (id),
+            FOREIGN KEY (manager_id) REFERENCES managers (id),
+            FOREIGN KEY (item_id) REFERENCES items (id)
+        )
+        """
+    )
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS settings (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+        """
+    )
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS standing_orders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            customer_id INTEGER NOT NULL,
+            item_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            delivery_partner_id INTEGER NOT NULL,
+            manager_id INTEGER NOT NULL,
+            active INTEGER NOT NULL DEFAULT 1,
+            end_date TEXT,
+            FOREIGN KEY (customer_id) REFERENCES customers (id),
+            FOREIGN KEY (item_id) REFERENCES items (id),
+            FOREIGN KEY (delivery_partner_id) REFERENCES delivery_partners (id),
+            FOREIGN KEY (manager_id) REFERENCES managers (id)
+        )
+        """
+    )
+    _ensure_column(cursor, "customers", "alt_contact", "TEXT")
+    _ensure_column(cursor, "daily_deliveries", "standing_order_id", "INTEGER")
+
+
+MONEY_COLUMNS = (
+    ("items", "price", "price_paise"),
+    ("daily_deliveries", "price", "price_paise"),
+    ("advance_payments", "amount", "amount_paise"),
+)
+
+
+def _migrate_money_to_paise(cursor):
+    pending = []
+    for table_name, real_column, paise_column in MONEY_COLUMNS:
+        columns = {col[1] for col in cursor.execute(f"PRAGMA table_info({table_name})")}
+        if real_column in columns:
+            pending.append((table_name, real_column, paise_column, paise_column in columns))
+    if not pending:
+        return
+    for trigger_name in cursor.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'trg_%_balance_%'"
+    ).fetchall():
+        cursor.execute(f"DROP TRIGGER {trigger_name[0]}")
+    cursor.execute("DROP TABLE IF EXISTS customer_balances")
+    for table_name, real_column, paise_column, has_paise in pending:
+        if not has_paise:
+            cursor.execute(
+                f"ALTER TABLE {table_name} "
+                f"ADD COLUMN {paise_column} INTEGER NOT NULL DEFAULT 0"
             )
-            """
+        cursor.execute(
+            f"UPDATE {table_name} "
+            f"SET {paise_column} = CAST(ROUND({real_column} * 100) AS INTEGER)"
         )
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS partner_allocations (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                date TEXT NOT NULL,
-                delivery_partner_id INTEGER NOT NULL,
-                manager_id INTEGER NOT NULL,
-                item_id INTEGER NOT NULL,
-                quantity INTEGER NOT NULL,
-                FOREIGN KEY (delivery_partner_id) REFERENCES delivery_partners (id),
-                FOREIGN KEY (manager_id) REFERENCES managers (id),
-                FOREIGN KEY (item_id) REFERENCES items (id)
+        cursor.execute(f"ALTER TABLE {table_name} DROP COLUMN {real_column}")
+
+
+def _ensure_indexes(cursor):
+    for index_name, table_name, columns in INDEXES:
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS {index_name} "
+            f"ON {table_name} ({', '.join(columns)})"
+        )
+    cursor.execute(
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_daily_deliveries_standing_order_date
+        ON daily_deliveries (standing_order_id, date)
+        WHERE standing_order_id IS NOT NULL
+        """
+    )
+
+
+def _ensure_customer_balances(cursor):
+    exists = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'customer_balances'"
+    ).fetchone()
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS customer_balances (
+            customer_id INTEGER PRIMARY KEY,
+            charges_paise INTEGER NOT NULL DEFAULT 0,
+            paid_paise INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (customer_id) REFERENCES customers (id)
+        )
+        """
+    )
+    for trigger_sql in BALANCE_TRIGGERS:
+        cursor.execute(trigger_sql)
+    if not exists:
+        _rebuild_customer_balances(cursor)
+
+
+def _rebuild_customer_balances(cursor):
+    cursor.execute("DELETE FROM customer_balances")
+    cursor.execute(
+        """
+        INSERT INTO customer_balances (customer_id, charges_paise, paid_paise)
+        SELECT customer_id, SUM(charges), SUM(paid)
+        FROM (
+            SELECT customer_id, SUM(quantity * price_paise) AS charges, 0 AS paid
+            FROM daily_deliveries
+            GROUP BY customer_id
+            UNION ALL
+            SELECT customer_id, 0 AS charges, SUM(amount_paise) AS paid
+            FROM advance_payments
+            GROUP BY customer_id
+        )
+        GROUP BY customer_id
+        """
+    )
+
+
+def rebuild_customer_balances():
+    with get_conn() as conn:
+        _rebuild_customer_balances(conn.cursor())
+
+
+def _ensure_customer_ledger_months(cursor):
+    exists = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'customer_ledger_months'"
+    ).fetchone()
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS customer_ledger_months (
+            customer_id INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            charges_paise INTEGER NOT NULL DEFAULT 0,
+            paid_paise INTEGER NOT NULL DEFAULT 0,
+            cum_charges_paise INTEGER NOT NULL DEFAULT 0,
+            cum_paid_paise INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (customer_id, month)
+        ) WITHOUT ROWID
+        """
+    )
+    for trigger_sql in LEDGER_MONTH_TRIGGERS:
+        cursor.execute(trigger_sql)
+    if not exists:
+        _rebuild_customer_ledger_months(cursor)
+
+
+LEDGER_MONTH_TOTALS_SQL = """
+    SELECT customer_id, month, SUM(charges) AS charges_paise, SUM(paid) AS paid_paise,
+           SUM(SUM(charges)) OVER w AS cum_charges_paise,
+           SUM(SUM(paid)) OVER w AS cum_paid_paise
+    FROM (
+        SELECT customer_id, substr(date, 1, 7) AS month,
+               SUM(quantity * price_paise) AS charges, 0 AS paid
+        FROM daily_deliveries
+        GROUP BY customer_id, month
+        UNION ALL
+        SELECT customer_id, substr(date, 1, 7) AS month, 0, SUM(amount_paise)
+        FROM advance_payments
+        GROUP BY customer_id, month
+    )
+    GROUP BY customer_id, month
+    WINDOW w AS (PARTITION BY customer_id ORDER BY month)
+"""
+
+
+def _rebuild_customer_ledger_months(cursor):
+    cursor.execute("DELETE FROM customer_ledger_months")
+    cursor.execute(
+        f"""
+        INSERT INTO customer_ledger_months
+            (customer_id, month, charges_paise, paid_paise, cum_charges_paise, cum_paid_paise)
+        {LEDGER_MONTH_TOTALS_SQL}
+        """
+    )
+
+
+def rebuild_customer_ledger_months():
+    with get_conn() as conn:
+        _rebuild_customer_ledger_months(conn.cursor())
+
+
+def verify_customer_ledger_months():
+    columns = "customer_id, month, charges_paise, paid_paise, cum_charges_paise, cum_paid_paise"
+    with get_conn() as conn:
+        # Months emptied by deletes stay behind as zero rows, which is harmless.
+        return conn.execute(
+            f"""
+            WITH stored AS (
+                SELECT {columns} FROM customer_ledger_months
+                WHERE charges_paise != 0 OR paid_paise != 0
+            ),
+            actual AS (
+                SELECT * FROM ({LEDGER_MONTH_TOTALS_SQL})
+                WHERE charges_paise != 0 OR paid_paise != 0
             )
+            SELECT 'stored' AS source, * FROM (SELECT * FROM stored EXCEPT SELECT * FROM actual)
+            UNION ALL
+            SELECT 'actual', * FROM (SELECT * FROM actual EXCEPT SELECT * FROM stored)
+            ORDER BY customer_id, month
             """
-        )
-        cur.execute(
+        ).fetchall()
+
+
+OPENING_BALANCES_SQL = """
+    SELECT customer_id, SUM(amount_paise) AS opening_paise
+    FROM (
+        SELECT customer_id, MAX(month) AS month,
+               cum_charges_paise - cum_paid_paise AS amount_paise
+        FROM customer_ledger_months
+        WHERE month < :month
+        GROUP BY customer_id
+        UNION ALL
+        SELECT customer_id, NULL, quantity * price_paise
+        FROM daily_deliveries
+        WHERE date >= :month_start AND date < :as_of
+        UNION ALL
+        SELECT customer_id, NULL, -amount_paise
+        FROM advance_payments
+        WHERE date >= :month_start AND date < :as_of
+    )
+    GROUP BY customer_id
+"""
+
+
+def _opening_params(as_of_date):
+    return {"month": as_of_date[:7], "month_start": f"{as_of_date[:7]}-01", "as_of": as_of_date}
+
+
+CUSTOMER_OPENING_SQL = """
+    COALESCE((
+        SELECT cum_charges_paise - cum_paid_paise FROM customer_ledger_months
+        WHERE customer_id = {customer_id} AND month < :month
+        ORDER BY month DESC LIMIT 1
+    ), 0)
+    + COALESCE((
+        SELECT SUM(quantity * price_paise) FROM daily_deliveries
+        WHERE customer_id = {customer_id} AND date >= :month_start AND date < :as_of
+    ), 0)
+    - COALESCE((
+        SELECT SUM(amount_paise) FROM advance_payments
+        WHERE customer_id = {customer_id} AND date >= :month_start AND date < :as_of
+    ), 0)
+"""
+
+
+def _opening_balance_paise(cursor, customer_id, as_of_date):
+    params = _opening_params(as_of_date)
+    params["customer_id"] = customer_id
+    return cursor.execute(
+        f"SELECT {CUSTOMER_OPENING_SQL.format(customer_id=':customer_id')}", params
+    ).fetchone()[0]
+
+
+def customer_opening_balance_paise(customer_id, as_of_date):
+    with get_conn() as conn:
+        return _opening_balance_paise(conn, customer_id, as_of_date)
+
+
+def customer_opening_balance(customer_id, as_of_date):
+    return from_paise(customer_opening_balance_paise(customer_id, as_of_date))
+
+
+def opening_balances_paise(as_of_date):
+    with get_conn() as conn:
+        return dict(conn.execute(OPENING_BALANCES_SQL, _opening_params(as_of_date)).fetchall())
+
+
+def verify_customer_balances():
+    with get_conn() as conn:
+        return conn.execute(
             """
-            CREATE TABLE IF NOT EXISTS settings (
-                key TEXT PRIMARY KEY,
-                value TEXT
+            WITH actual AS (
+                SELECT customer_id, SUM(charges) AS charges, SUM(paid) AS paid
+                FROM (
+                    SELECT customer_id, SUM(quantity * price_paise) AS charges, 0 AS paid
+                    FROM daily_deliveries
+                    GROUP BY customer_id
+                    UNION ALL
+                    SELECT customer_id, 0 AS charges, SUM(amount_paise) AS paid
+                    FROM advance_payments
+                    GROUP BY customer_id
+                )
+                GROUP BY customer_id
+            ),
+            keys AS (
+                SELECT customer_id FROM actual
+                UNION
+                SELECT customer_id FROM customer_balances
             )
+            SELECT k.customer_id,
+                   COALESCE(cb.charges_paise, 0) AS stored_charges_paise,
+                   COALESCE(a.charges, 0) AS actual_charges_paise,
+                   COALESCE(cb.paid_paise, 0) AS stored_paid_paise,
+                   COALESCE(a.paid, 0) AS actual_paid_paise
+            FROM keys k
+            LEFT JOIN customer_balances cb ON cb.customer_id = k.customer_id
+            LEFT JOIN actual a ON a.customer_id = k.customer_id
+            WHERE COALESCE(cb.charges_paise, 0) != COALESCE(a.charges, 0)
+               OR COALESCE(cb.paid_paise, 0) != COALESCE(a.paid, 0)
+            ORDER BY k.customer_id
             """
+        ).fetchall()
+
+
+DELIVERY_NATURAL_KEY = ("date", "customer_id", "item_id", "delivery_partner_id")
+NATURAL_KEY_INDEX = "idx_daily_deliveries_natural_key"
+
+
+def _duplicate_deliveries(cursor):
+    key = ", ".join(DELIVERY_NATURAL_KEY)
+    return cursor.execute(
+        f"""
+        SELECT {key}, COUNT(*) AS copies, GROUP_CONCAT(id) AS delivery_ids
+        FROM daily_deliveries
+        GROUP BY {key}
+        HAVING COUNT(*) > 1
+        ORDER BY date, customer_id
+        """
+    ).fetchall()
+
+
+def _ensure_delivery_natural_key(cursor):
+    # Opt-in only: plenty of books record two rounds of the same item for a
+    # customer on one day, and those have to be merged before this can apply.
+    duplicates = _duplicate_deliveries(cursor)
+    if duplicates:
+        logger.warning(
+            "Skipping %s: %d duplicate delivery groups; see find_duplicate_deliveries()",
+            NATURAL_KEY_INDEX,
+            len(duplicates),
         )
-        _ensure_column(cur, "customers", "alt_contact", "TEXT")
+        return False
+    cursor.execute(
+        f"CREATE UNIQUE INDEX IF NOT EXISTS {NATURAL_KEY_INDEX} "
+        f"ON daily_deliveries ({', '.join(DELIVERY_NATURAL_KEY)})"
+    )
+    return True
+
+
+def _drop_delivery_natural_key(cursor):
+    cursor.execute(f"DROP INDEX IF EXISTS {NATURAL_KEY_INDEX}")
+
+
+def _has_natural_key(cursor):
+    return (
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?",
+            (NATURAL_KEY_INDEX,),
+        ).fetchone()
+        is not None
+    )
+
+
+def find_duplicate_deliveries():
+    with get_conn() as conn:
+        return _duplicate_deliveries(conn)
+
+
+def enable_delivery_natural_key():
+    with get_conn() as conn:
+        return _ensure_delivery_natural_key(conn)
+
+
+def disable_delivery_natural_key():
+    with get_conn() as conn:
+        _drop_delivery_natural_key(conn)
+
+
+def delivery_natural_key_enabled():
+    with get_conn() as conn:
+        return _has_natural_key(conn)
+
+
+def query_plan(sql, params=()):
+    with get_conn() as conn:
+        rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+        return [row["detail"] for row in rows]
 
 
 def _ensure_column(cursor, table_name, column_name, column_type):
@@ -128,6 +1055,118 @@ def _ensure_column(cursor, table_name, column_name, column_type):
         )
 
 
+def _ensure_standing_order_start_date(cursor):
+    _ensure_column(cursor, "standing_orders", "start_date", "TEXT")
+
+
+SCHEMA_MIGRATIONS = (
+    _create_base_schema,
+    _migrate_money_to_paise,
+    _ensure_indexes,
+    _ensure_customer_balances,
+    _ensure_customer_ledger_months,
+    _ensure_standing_order_start_date,
+)
+SCHEMA_VERSION = len(SCHEMA_MIGRATIONS)
+
+
+class _RecordMixin:
+    # Named tuples that also answer row["column"], row.get() and row.keys(), so
+    # callers written against sqlite3.Row or dicts keep working unchanged.
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            try:
+                key = self._index[key]
+            except KeyError:
+                raise IndexError(f"No item with that key: {key!r}") from None
+        return tuple.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        index = self._index.get(key)
+        return default if index is None else tuple.__getitem__(self, index)
+
+    def keys(self):
+        return list(self._fields)
+
+
+def _record_type(name, fields):
+    fields = tuple(fields.split())
+    record = type(
+        name,
+        (_RecordMixin, namedtuple(name, fields, module=__name__)),
+        {
+            "__slots__": (),
+            "__module__": __name__,
+            "_index": {field: position for position, field in enumerate(fields)},
+        },
+    )
+    new = tuple.__new__
+    record.row_factory = staticmethod(lambda cursor, row: new(record, row))
+    return record
+
+
+Delivery = _record_type(
+    "Delivery",
+    "id date customer_id item_id quantity price_paise delivery_partner_id "
+    "manager_id standing_order_id price customer_name item_name partner_name "
+    "manager_name",
+)
+Payment = _record_type(
+    "Payment", "id customer_id amount_paise date notes amount customer_name"
+)
+Allocation = _record_type(
+    "Allocation",
+    "id date delivery_partner_id manager_id item_id quantity item_name "
+    "manager_name partner_name",
+)
+Customer = _record_type(
+    "Customer", "id name contact address alt_delivery_partner_id alt_contact active"
+)
+CustomerBalance = _record_type(
+    "CustomerBalance", " ".join(Customer._fields) + " charges paid"
+)
+
+CUSTOMER_COLUMNS = (
+    "c.id, c.name, c.contact, c.address, c.alt_delivery_partner_id, "
+    "c.alt_contact, c.active"
+)
+
+
+def _execute(conn, sql, params=(), record=None):
+    cursor = conn.cursor()
+    if record is not None:
+        cursor.row_factory = record.row_factory
+    return cursor.execute(sql, params)
+
+
+_master_version = 0
+_master_cache = {}
+_master_lock = threading.Lock()
+
+
+def _bump_master_version():
+    global _master_version
+    with _master_lock:
+        _master_version += 1
+
+
+def _cached_master_query(sql, record=None):
+    pool = get_pool()
+    cache_key = (pool.path, sql)
+    stamp = (_master_version, pool.data_version())
+    with _master_lock:
+        cached = _master_cache.get(cache_key)
+        if cached and cached[0] == stamp:
+            return list(cached[1])
+    with get_conn() as conn:
+        rows = _execute(conn, sql, record=record).fetchall()
+    with _master_lock:
+        _master_cache[cache_key] = (stamp, rows)
+    return list(rows)
+
+
 def add_customer(name, contact, address, alt_contact):
     with get_conn() as conn:
         conn.execute(
@@ -137,6 +1176,7 @@ def add_customer(name, contact, address, alt_contact):
             """,
             (name, contact, address, alt_contact or None),
         )
+    _bump_master_version()
 
 
 def update_customer(customer_id, name, contact, address, alt_contact):
@@ -149,6 +1189,7 @@ def update_customer(customer_id, name, contact, address, alt_contact):
             """,
             (name, contact, address, alt_contact, customer_id),
         )
+    _bump_master_version()
 
 
 def deactivate_customer(customer_id):
@@ -156,6 +1197,7 @@ def deactivate_customer(customer_id):
         conn.execute(
             "UPDATE customers SET active = 0 WHERE id = ?", (customer_id,)
         )
+    _bump_master_version()
 
 
 def add_delivery_partner(name, contact, address):
@@ -167,6 +1209,7 @@ def add_delivery_partner(name, contact, address):
             """,
             (name, contact, address),
         )
+    _bump_master_version()
 
 
 def update_delivery_partner(partner_id, name, contact, address):
@@ -179,6 +1222,7 @@ def update_delivery_partner(partner_id, name, contact, address):
             """,
             (name, contact, address, partner_id),
         )
+    _bump_master_version()
 
 
 def deactivate_delivery_partner(partner_id):
@@ -186,27 +1230,31 @@ def deactivate_delivery_partner(partner_id):
         conn.execute(
             "UPDATE delivery_partners SET active = 0 WHERE id = ?", (partner_id,)
         )
+    _bump_master_version()
 
 
 def add_item(name, price):
     with get_conn() as conn:
         conn.execute(
-            "INSERT INTO items (name, price) VALUES (?, ?)",
-            (name, price),
+            "INSERT INTO items (name, price_paise) VALUES (?, ?)",
+            (name, to_paise(price)),
         )
+    _bump_master_version()
 
 
 def update_item(item_id, name, price):
     with get_conn() as conn:
         conn.execute(
-            "UPDATE items SET name = ?, price = ? WHERE id = ?",
-            (name, price, item_id),
+            "UPDATE items SET name = ?, price_paise = ? WHERE id = ?",
+            (name, to_paise(price), item_id),
         )
+    _bump_master_version()
 
 
 def delete_item(item_id):
     with get_conn() as conn:
         conn.execute("DELETE FROM items WHERE id = ?", (item_id,))
+    _bump_master_version()
 
 
 def add_manager(name, contact):
@@ -215,6 +1263,31 @@ def add_manager(name, contact):
             "INSERT INTO managers (name, contact) VALUES (?, ?)",
             (name, contact),
         )
+    _bump_master_version()
+
+
+MASTER_INSERTS = {
+    "customers": (
+        "INSERT INTO customers (name, contact, address, alt_contact) VALUES (?, ?, ?, ?)"
+    ),
+    "delivery_partners": (
+        "INSERT INTO delivery_partners (name, contact, address) VALUES (?, ?, ?)"
+    ),
+    "items": "INSERT INTO items (name, price_paise) VALUES (?, ?)",
+    "managers": "INSERT INTO managers (name, contact) VALUES (?, ?)",
+}
+
+
+def add_masters_bulk(table_name, rows):
+    if table_name not in MASTER_INSERTS:
+        raise ValueError(f"Unknown master table: {table_name}")
+    rows = list(rows)
+    if not rows:
+        return 0
+    with get_conn() as conn:
+        conn.executemany(MASTER_INSERTS[table_name], rows)
+    _bump_master_version()
+    return len(rows)
 
 
 def update_manager(manager_id, name, contact):
@@ -223,45 +1296,136 @@ def update_manager(manager_id, name, contact):
             "UPDATE managers SET name = ?, contact = ? WHERE id = ?",
             (name, contact, manager_id),
         )
+    _bump_master_version()
 
 
 def delete_manager(manager_id):
     with get_conn() as conn:
         conn.execute("DELETE FROM managers WHERE id = ?", (manager_id,))
+    _bump_master_version()
 
 
 def add_advance_payment(customer_id, amount, payment_date, notes):
     with get_conn() as conn:
         conn.execute(
             """
-            INSERT INTO advance_payments (customer_id, amount, date, notes)
+            INSERT INTO advance_payments (customer_id, amount_paise, date, notes)
             VALUES (?, ?, ?, ?)
             """,
-            (customer_id, amount, payment_date, notes),
+            (customer_id, to_paise(amount), payment_date, notes),
         )
 
 
-def list_advance_payments(payment_date=None):
+def add_advance_payments_bulk(rows):
+    values = [
+        (customer_id, to_paise(amount), payment_date, notes)
+        for customer_id, amount, payment_date, notes in rows
+    ]
+    if not values:
+        return 0
     with get_conn() as conn:
-        if payment_date:
-            return conn.execute(
-                """
-                SELECT ap.*, c.name AS customer_name
-                FROM advance_payments ap
-                JOIN customers c ON c.id = ap.customer_id
-                WHERE ap.date = ?
-                ORDER BY ap.id DESC
-                """,
-                (payment_date,),
-            ).fetchall()
-        return conn.execute(
-            """
-            SELECT ap.*, c.name AS customer_name
-            FROM advance_payments ap
-            JOIN customers c ON c.id = ap.customer_id
-            ORDER BY ap.id DESC
+        conn.executemany(
             """
-        ).fetchall()
+            INSERT INTO advance_payments (customer_id, amount_paise, date, notes)
+            VALUES (?, ?, ?, ?)
+            """,
+            values,
+        )
+    return len(values)
+
+
+PAYMENT_SELECT = """
+    SELECT ap.id, ap.customer_id, ap.amount_paise, ap.date, ap.notes,
+           ap.amount_paise / 100.0 AS amount, c.name AS customer_name
+    FROM advance_payments ap
+    JOIN customers c ON c.id = ap.customer_id
+"""
+
+
+def _build_query(select_sql, conditions, params, order_by, limit=None, offset=0):
+    sql = select_sql
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += f" ORDER BY {order_by}"
+    params = list(params)
+    if limit is not None:
+        sql += " LIMIT ? OFFSET ?"
+        params.extend([limit, offset])
+    return sql, params
+
+
+def _list_query(
+    select_sql, conditions, params, order_by, limit=None, offset=0, record=None
+):
+    sql, params = _build_query(select_sql, conditions, params, order_by, limit, offset)
+    with get_conn() as conn:
+        return _execute(conn, sql, params, record).fetchall()
+
+
+def _iter_query(sql, params=(), chunk_size=None, record=None):
+    # The pooled connection stays checked out until the generator is exhausted
+    # or closed, so callers should consume it promptly.
+    with get_conn() as conn:
+        yield from _iter_cursor(conn, sql, params, chunk_size, record)
+
+
+def _iter_cursor(conn, sql, params=(), chunk_size=None, record=None):
+    chunk_size = chunk_size or ITER_CHUNK_SIZE
+    cursor = _execute(conn, sql, params, record)
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield from rows
+
+
+def _customer_ids_condition(alias, conditions, params, customer_ids):
+    if customer_ids is not None:
+        conditions.append(f"{alias}.customer_id IN (SELECT value FROM json_each(?))")
+        params.append(json.dumps([int(cid) for cid in customer_ids]))
+
+
+def _date_range_conditions(alias, start_date, end_date):
+    conditions = []
+    params = []
+    if start_date:
+        conditions.append(f"{alias}.date >= ?")
+        params.append(start_date)
+    if end_date:
+        conditions.append(f"{alias}.date <= ?")
+        params.append(end_date)
+    return conditions, params
+
+
+def _keyset_condition(alias, conditions, params, after_id):
+    if after_id is not None:
+        conditions.append(f"{alias}.id < ?")
+        params.append(after_id)
+
+
+def list_advance_payments(payment_date=None, after_id=None, page_size=None):
+    conditions, params = (["ap.date = ?"], [payment_date]) if payment_date else ([], [])
+    _keyset_condition("ap", conditions, params, after_id)
+    return _list_query(
+        PAYMENT_SELECT, conditions, params, "ap.id DESC", page_size, record=Payment
+    )
+
+
+def list_advance_payments_range(
+    start_date=None, end_date=None, limit=None, offset=0, after_id=None
+):
+    conditions, params = _date_range_conditions("ap", start_date, end_date)
+    _keyset_condition("ap", conditions, params, after_id)
+    return _list_query(
+        PAYMENT_SELECT, conditions, params, "ap.id DESC", limit, offset, record=Payment
+    )
+
+
+def iter_advance_payments(start_date=None, end_date=None, customer_ids=None, chunk_size=None):
+    conditions, params = _date_range_conditions("ap", start_date, end_date)
+    _customer_ids_condition("ap", conditions, params, customer_ids)
+    sql, params = _build_query(PAYMENT_SELECT, conditions, params, "ap.date, ap.id")
+    return _iter_query(sql, params, chunk_size, Payment)
 
 
 def update_advance_payment(payment_id, customer_id, amount, payment_date, notes):
@@ -269,10 +1433,10 @@ def update_advance_payment(payment_id, customer_id, amount, payment_date, notes)
         conn.execute(
             """
             UPDATE advance_payments
-            SET customer_id = ?, amount = ?, date = ?, notes = ?
+            SET customer_id = ?, amount_paise = ?, date = ?, notes = ?
             WHERE id = ?
             """,
-            (customer_id, amount, payment_date, notes, payment_id),
+            (customer_id, to_paise(amount), payment_date, notes, payment_id),
         )
 
 
@@ -294,7 +1458,7 @@ def add_daily_delivery(
         conn.execute(
             """
             INSERT INTO daily_deliveries
-            (date, customer_id, item_id, quantity, price, delivery_partner_id, manager_id)
+            (date, customer_id, item_id, quantity, price_paise, delivery_partner_id, manager_id)
             VALUES (?, ?, ?, ?, ?, ?, ?)
             """,
             (
@@ -302,42 +1466,166 @@ def add_daily_delivery(
                 customer_id,
                 item_id,
                 quantity,
-                price,
+                to_paise(price),
                 delivery_partner_id,
                 manager_id,
             ),
         )
 
 
-def list_daily_deliveries(delivery_date=None):
-    with get_conn() as conn:
-        if delivery_date:
-            return conn.execute(
-                """
-                SELECT dd.*, c.name AS customer_name, i.name AS item_name,
-                       dp.name AS partner_name, m.name AS manager_name
-                FROM daily_deliveries dd
-                JOIN customers c ON c.id = dd.customer_id
-                JOIN items i ON i.id = dd.item_id
-                JOIN delivery_partners dp ON dp.id = dd.delivery_partner_id
-                JOIN managers m ON m.id = dd.manager_id
-                WHERE dd.date = ?
-                ORDER BY dd.id DESC
-                """,
-                (delivery_date,),
-            ).fetchall()
-        return conn.execute(
-            """
-            SELECT dd.*, c.name AS customer_name, i.name AS item_name,
-                   dp.name AS partner_name, m.name AS manager_name
-            FROM daily_deliveries dd
-            JOIN customers c ON c.id = dd.customer_id
-            JOIN items i ON i.id = dd.item_id
-            JOIN delivery_partners dp ON dp.id = dd.delivery_partner_id
-            JOIN managers m ON m.id = dd.manager_id
-            ORDER BY dd.id DESC
+DELIVERY_FIELDS = (
+    "date",
+    "customer_id",
+    "item_id",
+    "quantity",
+    "price",
+    "delivery_partner_id",
+    "manager_id",
+)
+
+
+def _delivery_values(row, position):
+    if isinstance(row, dict):
+        missing = [field for field in DELIVERY_FIELDS if row.get(field) in (None, "")]
+        if missing:
+            raise ValueError(f"Row {position}: missing {', '.join(missing)}")
+        values = [row[field] for field in DELIVERY_FIELDS]
+    else:
+        values = list(row)
+        if len(values) != len(DELIVERY_FIELDS):
+            raise ValueError(
+                f"Row {position}: expected {len(DELIVERY_FIELDS)} values, got {len(values)}"
+            )
+    delivery_date, customer_id, item_id, quantity, price, partner_id, manager_id = values
+    try:
+        delivery_date = date.fromisoformat(delivery_date).strftime("%Y-%m-%d")
+    except (TypeError, ValueError):
+        raise ValueError(f"Row {position}: invalid date {delivery_date!r}") from None
+    try:
+        ids = [int(customer_id), int(item_id), int(partner_id), int(manager_id)]
+        quantity = Decimal(str(quantity).strip())
+        price_paise = to_paise(price)
+    except (TypeError, ValueError, ArithmeticError):
+        raise ValueError(f"Row {position}: ids, quantity and price must be numbers") from None
+    if not quantity.is_finite() or quantity != quantity.to_integral_value():
+        raise ValueError(f"Row {position}: quantity must be a whole number")
+    quantity = int(quantity)
+    if quantity <= 0:
+        raise ValueError(f"Row {position}: quantity must be positive")
+    if price_paise is None:
+        raise ValueError(f"Row {position}: missing price")
+    if price_paise < 0:
+        raise ValueError(f"Row {position}: price cannot be negative")
+    return (delivery_date, ids[0], ids[1], quantity, price_paise, ids[2], ids[3])
+
+
+def add_daily_deliveries_bulk(rows):
+    values = [_delivery_values(row, position) for position, row in enumerate(rows, 1)]
+    if not values:
+        return []
+    with get_conn() as conn:
+        conn.executemany(
             """
-        ).fetchall()
+            INSERT INTO daily_deliveries
+            (date, customer_id, item_id, quantity, price_paise, delivery_partner_id, manager_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            values,
+        )
+        last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+        return list(range(last_id - len(values) + 1, last_id + 1))
+
+
+UPSERT_DELIVERY_SQL = f"""
+    INSERT INTO daily_deliveries
+    (date, customer_id, item_id, quantity, price_paise, delivery_partner_id, manager_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT ({", ".join(DELIVERY_NATURAL_KEY)}) DO UPDATE SET
+        quantity = excluded.quantity,
+        price_paise = excluded.price_paise,
+        manager_id = excluded.manager_id
+"""
+
+
+def _require_natural_key(conn):
+    # Without the unique index several rounds may share a key, and there is no
+    # telling which of them an upsert should replace.
+    if not _has_natural_key(conn):
+        raise ValueError(
+            "Upserting deliveries needs the natural key; call enable_delivery_natural_key()"
+        )
+
+
+def upsert_daily_delivery(
+    delivery_date,
+    customer_id,
+    item_id,
+    quantity,
+    price,
+    delivery_partner_id,
+    manager_id,
+):
+    values = _delivery_values(
+        (delivery_date, customer_id, item_id, quantity, price, delivery_partner_id, manager_id),
+        1,
+    )
+    with get_conn() as conn:
+        _require_natural_key(conn)
+        return conn.execute(UPSERT_DELIVERY_SQL + " RETURNING id", values).fetchone()[0]
+
+
+def upsert_daily_deliveries_bulk(rows):
+    values = [_delivery_values(row, position) for position, row in enumerate(rows, 1)]
+    if not values:
+        return 0, 0
+    with get_conn() as conn:
+        _require_natural_key(conn)
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM daily_deliveries").fetchone()[0]
+        conn.executemany(UPSERT_DELIVERY_SQL, values)
+        inserted = conn.execute(
+            "SELECT COUNT(*) FROM daily_deliveries WHERE id > ?", (last_id,)
+        ).fetchone()[0]
+    return inserted, len(values) - inserted
+
+
+DELIVERY_SELECT = """
+    SELECT dd.id, dd.date, dd.customer_id, dd.item_id, dd.quantity, dd.price_paise,
+           dd.delivery_partner_id, dd.manager_id, dd.standing_order_id,
+           dd.price_paise / 100.0 AS price, c.name AS customer_name,
+           i.name AS item_name, dp.name AS partner_name, m.name AS manager_name
+    FROM daily_deliveries dd
+    JOIN customers c ON c.id = dd.customer_id
+    JOIN items i ON i.id = dd.item_id
+    JOIN delivery_partners dp ON dp.id = dd.delivery_partner_id
+    JOIN managers m ON m.id = dd.manager_id
+"""
+
+
+def list_daily_deliveries(delivery_date=None, after_id=None, page_size=None):
+    conditions, params = (["dd.date = ?"], [delivery_date]) if delivery_date else ([], [])
+    _keyset_condition("dd", conditions, params, after_id)
+    return _list_query(
+        DELIVERY_SELECT, conditions, params, "dd.id DESC", page_size, record=Delivery
+    )
+
+
+def list_daily_deliveries_range(
+    start_date=None, end_date=None, limit=None, offset=0, after_id=None
+):
+    conditions, params = _date_range_conditions("dd", start_date, end_date)
+    _keyset_condition("dd", conditions, params, after_id)
+    return _list_query(
+        DELIVERY_SELECT, conditions, params, "dd.id DESC", limit, offset, record=Delivery
+    )
+
+
+def iter_daily_deliveries(start_date=None, end_date=None, customer_ids=None, chunk_size=None):
+    conditions, params = _date_range_conditions("dd", start_date, end_date)
+    _customer_ids_condition("dd", conditions, params, customer_ids)
+    sql, params = _build_query(DELIVERY_SELECT, conditions, params, "dd.date, dd.id")
+    return _iter_query(sql, params, chunk_size, Delivery)
 
 
 def update_daily_delivery(
@@ -354,7 +1642,7 @@ def update_daily_delivery(
         conn.execute(
             """
             UPDATE daily_deliveries
-            SET date = ?, customer_id = ?, item_id = ?, quantity = ?, price = ?,
+            SET date = ?, customer_id = ?, item_id = ?, quantity = ?, price_paise = ?,
                 delivery_partner_id = ?, manager_id = ?
             WHERE id = ?
             """,
@@ -363,7 +1651,7 @@ def update_daily_delivery(
                 customer_id,
                 item_id,
                 quantity,
-                price,
+                to_paise(price),
                 delivery_partner_id,
                 manager_id,
                 delivery_id,
@@ -375,6 +1663,124 @@ def delete_daily_delivery(delivery_id):
     with get_conn() as conn:
         conn.execute("DELETE FROM daily_deliveries WHERE id = ?", (delivery_id,))
 
+def add_standing_order(
+    customer_id,
+    item_id,
+    quantity,
+    delivery_partner_id,
+    manager_id,
+    end_date=None,
+    start_date=None,
+):
+    with get_conn() as conn:
+        conn.execute(
+            """
+            INSERT INTO standing_orders
+            (customer_id, item_id, quantity, delivery_partner_id, manager_id, start_date,
+             end_date)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                customer_id,
+                item_id,
+                quantity,
+                delivery_partner_id,
+                manager_id,
+                start_date or None,
+                end_date or None,
+            ),
+        )
+
+
+def update_standing_order(
+    order_id,
+    customer_id,
+    item_id,
+    quantity,
+    delivery_partner_id,
+    manager_id,
+    end_date=None,
+    start_date=None,
+):
+    with get_conn() as conn:
+        conn.execute(
+            """
+            UPDATE standing_orders
+            SET customer_id = ?, item_id = ?, quantity = ?, delivery_partner_id = ?,
+                manager_id = ?, start_date = ?, end_date = ?
+            WHERE id = ?
+            """,
+            (
+                customer_id,
+                item_id,
+                quantity,
+                delivery_partner_id,
+                manager_id,
+                start_date or None,
+                end_date or None,
+                order_id,
+            ),
+        )
+
+
+def deactivate_standing_order(order_id):
+    with get_conn() as conn:
+        conn.execute("UPDATE standing_orders SET active = 0 WHERE id = ?", (order_id,))
+
+
+def list_standing_orders(active_only=True):
+    with get_conn() as conn:
+        return conn.execute(
+            f"""
+            SELECT so.*, c.name AS customer_name, i.name AS item_name,
+                   dp.name AS partner_name, m.name AS manager_name
+            FROM standing_orders so
+            JOIN customers c ON c.id = so.customer_id
+            JOIN items i ON i.id = so.item_id
+            JOIN delivery_partners dp ON dp.id = so.delivery_partner_id
+            JOIN managers m ON m.id = so.manager_id
+            {"WHERE so.active = 1" if active_only else ""}
+            ORDER BY dp.name, c.name
+            """
+        ).fetchall()
+
+
+def generate_standing_deliveries(start_date, end_date=None):
+    end_date = end_date or start_date
+    if end_date < start_date:
+        raise ValueError("End date cannot be before start date.")
+    with get_conn() as conn:
+        cur = conn.execute(
+            """
+            INSERT OR IGNORE INTO daily_deliveries
+            (date, customer_id, item_id, quantity, price_paise, delivery_partner_id, manager_id,
+             standing_order_id)
+            WITH RECURSIVE days(day) AS (
+                SELECT date(:start_date)
+                UNION ALL
+                SELECT date(day, '+1 day') FROM days WHERE day < :end_date
+            )
+            SELECT days.day, so.customer_id, so.item_id, so.quantity, i.price_paise,
+                   so.delivery_partner_id, so.manager_id, so.id
+            FROM days
+            JOIN standing_orders so
+            JOIN items i ON i.id = so.item_id
+            JOIN customers c ON c.id = so.customer_id
+            WHERE so.active = 1
+              AND c.active = 1
+              AND (so.start_date IS NULL OR so.start_date <= days.day)
+              AND (so.end_date IS NULL OR so.end_date >= days.day)
+              AND NOT EXISTS (
+                  SELECT 1 FROM daily_deliveries dd
+                  WHERE dd.standing_order_id = so.id AND dd.date = days.day
+              )
+            ORDER BY days.day, so.id
+            """,
+            {"start_date": start_date, "end_date": end_date},
+        )
+        return cur.rowcount
+
+
 def add_partner_allocation(allocation_date, partner_id, manager_id, item_id, quantity):
     with get_conn() as conn:
         conn.execute(
@@ -387,33 +1793,39 @@ def add_partner_allocation(allocation_date, partner_id, manager_id, item_id, qua
         )
 
 
-def list_partner_allocations_all(allocation_date=None):
-    with get_conn() as conn:
-        if allocation_date:
-            return conn.execute(
-                """
-                SELECT pa.*, i.name AS item_name, m.name AS manager_name,
-                       dp.name AS partner_name
-                FROM partner_allocations pa
-                JOIN items i ON i.id = pa.item_id
-                JOIN managers m ON m.id = pa.manager_id
-                JOIN delivery_partners dp ON dp.id = pa.delivery_partner_id
-                WHERE pa.date = ?
-                ORDER BY pa.id DESC
-                """,
-                (allocation_date,),
-            ).fetchall()
-        return conn.execute(
-            """
-            SELECT pa.*, i.name AS item_name, m.name AS manager_name,
-                   dp.name AS partner_name
-            FROM partner_allocations pa
-            JOIN items i ON i.id = pa.item_id
-            JOIN managers m ON m.id = pa.manager_id
-            JOIN delivery_partners dp ON dp.id = pa.delivery_partner_id
-            ORDER BY pa.id DESC
-            """
-        ).fetchall()
+ALLOCATION_SELECT = """
+    SELECT pa.id, pa.date, pa.delivery_partner_id, pa.manager_id, pa.item_id,
+           pa.quantity, i.name AS item_name, m.name AS manager_name,
+           dp.name AS partner_name
+    FROM partner_allocations pa
+    JOIN items i ON i.id = pa.item_id
+    JOIN managers m ON m.id = pa.manager_id
+    JOIN delivery_partners dp ON dp.id = pa.delivery_partner_id
+"""
+
+
+def list_partner_allocations_all(allocation_date=None, after_id=None, page_size=None):
+    conditions, params = (["pa.date = ?"], [allocation_date]) if allocation_date else ([], [])
+    _keyset_condition("pa", conditions, params, after_id)
+    return _list_query(
+        ALLOCATION_SELECT, conditions, params, "pa.id DESC", page_size, record=Allocation
+    )
+
+
+def list_partner_allocations_range(
+    start_date=None, end_date=None, limit=None, offset=0, after_id=None
+):
+    conditions, params = _date_range_conditions("pa", start_date, end_date)
+    _keyset_condition("pa", conditions, params, after_id)
+    return _list_query(
+        ALLOCATION_SELECT, conditions, params, "pa.id DESC", limit, offset, record=Allocation
+    )
+
+
+def iter_partner_allocations(start_date=None, end_date=None, chunk_size=None):
+    conditions, params = _date_range_conditions("pa", start_date, end_date)
+    sql, params = _build_query(ALLOCATION_SELECT, conditions, params, "pa.date, pa.id")
+    return _iter_query(sql, params, chunk_size, Allocation)
 
 
 def update_partner_allocation(allocation_id, allocation_date, partner_id, manager_id, item_id, quantity):
@@ -433,56 +1845,52 @@ def delete_partner_allocation(allocation_id):
         conn.execute("DELETE FROM partner_allocations WHERE id = ?", (allocation_id,))
 
 def list_customers(active_only=True):
-    with get_conn() as conn:
-        if active_only:
-            return conn.execute(
-                "SELECT * FROM customers WHERE active = 1 ORDER BY name"
-            ).fetchall()
-        return conn.execute("SELECT * FROM customers ORDER BY name").fetchall()
+    if active_only:
+        return _cached_master_query(
+            f"SELECT {CUSTOMER_COLUMNS} FROM customers c WHERE c.active = 1 ORDER BY c.name",
+            Customer,
+        )
+    return _cached_master_query(
+        f"SELECT {CUSTOMER_COLUMNS} FROM customers c ORDER BY c.name", Customer
+    )
 
 
 def list_customers_with_balance(search_text=""):
     term = f"%{search_text.strip()}%"
     with get_conn() as conn:
-        return conn.execute(
-            """
-            SELECT c.*,
-                   COALESCE((
-                       SELECT SUM(dd.quantity * dd.price)
-                       FROM daily_deliveries dd
-                       WHERE dd.customer_id = c.id
-                   ), 0) AS charges,
-                   COALESCE((
-                       SELECT SUM(ap.amount)
-                       FROM advance_payments ap
-                       WHERE ap.customer_id = c.id
-                   ), 0) AS paid
+        return _execute(
+            conn,
+            f"""
+            SELECT {CUSTOMER_COLUMNS},
+                   COALESCE(cb.charges_paise, 0) / 100.0 AS charges,
+                   COALESCE(cb.paid_paise, 0) / 100.0 AS paid
             FROM customers c
+            LEFT JOIN customer_balances cb ON cb.customer_id = c.id
             WHERE c.active = 1
               AND (c.name LIKE ? OR c.contact LIKE ? OR c.address LIKE ?)
             ORDER BY c.name
             """,
             (term, term, term),
+            CustomerBalance,
         ).fetchall()
 
 
 def list_delivery_partners(active_only=True):
-    with get_conn() as conn:
-        if active_only:
-            return conn.execute(
-                "SELECT * FROM delivery_partners WHERE active = 1 ORDER BY name"
-            ).fetchall()
-        return conn.execute("SELECT * FROM delivery_partners ORDER BY name").fetchall()
+    if active_only:
+        return _cached_master_query(
+            "SELECT * FROM delivery_partners WHERE active = 1 ORDER BY name"
+        )
+    return _cached_master_query("SELECT * FROM delivery_partners ORDER BY name")
 
 
 def list_items():
-    with get_conn() as conn:
-        return conn.execute("SELECT * FROM items ORDER BY name").fetchall()
+    return _cached_master_query(
+        "SELECT *, price_paise / 100.0 AS price FROM items ORDER BY name"
+    )
 
 
 def list_managers():
-    with get_conn() as conn:
-        return conn.execute("SELECT * FROM managers ORDER BY name").fetchall()
+    return _cached_master_query("SELECT * FROM managers ORDER BY name")
 
 
 def list_partner_allocations(partner_id, allocation_date):
@@ -504,7 +1912,8 @@ def list_partner_deliveries(partner_id, delivery_date):
     with get_conn() as conn:
         return conn.execute(
             """
-            SELECT dd.*, c.name AS customer_name, i.name AS item_name, m.name AS manager_name
+            SELECT dd.*, dd.price_paise / 100.0 AS price, c.name AS customer_name,
+                   i.name AS item_name, m.name AS manager_name
             FROM daily_deliveries dd
             JOIN customers c ON c.id = dd.customer_id
             JOIN items i ON i.id = dd.item_id
@@ -537,62 +1946,322 @@ def partner_remaining(partner_id, day):
         return alloc - delivered
 
 
-def monthly_customer_statement(customer_id, month_yyyy_mm):
+def partner_reconciliation(day):
     with get_conn() as conn:
-        deliveries = conn.execute(
-            """
-            SELECT dd.date, dd.quantity, dd.price,
-                   i.name AS item_name,
-                   dp.name AS partner_name
-            FROM daily_deliveries dd
-            JOIN items i ON i.id = dd.item_id
-            JOIN delivery_partners dp ON dp.id = dd.delivery_partner_id
-            WHERE dd.customer_id = ?
-              AND substr(dd.date, 1, 7) = ?
-            ORDER BY dd.date
-            """,
-            (customer_id, month_yyyy_mm),
-        ).fetchall()
-        payments = conn.execute(
+        return conn.execute(
             """
-            SELECT date, amount, notes
-            FROM advance_payments
-            WHERE customer_id = ?
-              AND substr(date, 1, 7) = ?
-            ORDER BY date
+            SELECT t.delivery_partner_id AS partner_id, dp.name AS partner_name,
+                   t.item_id, i.name AS item_name,
+                   SUM(t.allocated) AS allocated,
+                   SUM(t.delivered) AS delivered,
+                   SUM(t.allocated) - SUM(t.delivered) AS remaining
+            FROM (
+                SELECT delivery_partner_id, item_id, quantity AS allocated, 0 AS delivered
+                FROM partner_allocations
+                WHERE date = ?
+                UNION ALL
+                SELECT delivery_partner_id, item_id, 0 AS allocated, quantity AS delivered
+                FROM daily_deliveries
+                WHERE date = ?
+            ) t
+            JOIN delivery_partners dp ON dp.id = t.delivery_partner_id
+            JOIN items i ON i.id = t.item_id
+            GROUP BY t.delivery_partner_id, t.item_id
+            ORDER BY dp.name, i.name
             """,
-            (customer_id, month_yyyy_mm),
+            (day, day),
         ).fetchall()
-        return deliveries, payments
+
+
+def month_range(month_yyyy_mm):
+    year, month = (int(part) for part in month_yyyy_mm.split("-")[:2])
+    start = date(year, month, 1)
+    end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    return start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")
+
+
+STATEMENT_DELIVERY_SELECT = """
+    SELECT dd.customer_id, dd.date, dd.quantity, dd.price_paise,
+           dd.price_paise / 100.0 AS price,
+           i.name AS item_name,
+           dp.name AS partner_name
+    FROM daily_deliveries dd
+    JOIN items i ON i.id = dd.item_id
+    JOIN delivery_partners dp ON dp.id = dd.delivery_partner_id
+"""
+
+STATEMENT_PAYMENT_SELECT = """
+    SELECT ap.customer_id, ap.date, ap.amount_paise,
+           ap.amount_paise / 100.0 AS amount, ap.notes
+    FROM advance_payments ap
+"""
+
+
+def monthly_customer_statement(customer_id, month_yyyy_mm):
+    month_start, next_month_start = month_range(month_yyyy_mm)
+    deliveries = _list_query(
+        STATEMENT_DELIVERY_SELECT,
+        ["dd.customer_id = ?", "dd.date >= ?", "dd.date < ?"],
+        [customer_id, month_start, next_month_start],
+        "dd.date",
+    )
+    payments = _list_query(
+        STATEMENT_PAYMENT_SELECT,
+        ["ap.customer_id = ?", "ap.date >= ?", "ap.date < ?"],
+        [customer_id, month_start, next_month_start],
+        "ap.date",
+    )
+    return deliveries, payments
 
 
 def customer_statement_range(customer_id, start_date, end_date):
+    deliveries = _list_query(
+        STATEMENT_DELIVERY_SELECT,
+        ["dd.customer_id = ?", "dd.date BETWEEN ? AND ?"],
+        [customer_id, start_date, end_date],
+        "dd.date",
+    )
+    payments = _list_query(
+        STATEMENT_PAYMENT_SELECT,
+        ["ap.customer_id = ?", "ap.date BETWEEN ? AND ?"],
+        [customer_id, start_date, end_date],
+        "ap.date",
+    )
+    return deliveries, payments
+
+
+Bill = _record_type("Bill", "customer_id customer_name qty amount paid opening due")
+BillLine = _record_type("BillLine", "customer_id customer_name item_name qty amount")
+
+BILLING_DELIVERY_SQL = """
+    SELECT customer_id, item_id, SUM(quantity), SUM(quantity * price_paise)
+    FROM daily_deliveries
+    WHERE date >= ? AND date < ?
+    GROUP BY customer_id, item_id
+"""
+
+BILLING_PAYMENT_SQL = """
+    SELECT customer_id, SUM(amount_paise)
+    FROM advance_payments
+    WHERE date >= ? AND date < ?
+    GROUP BY customer_id
+"""
+
+
+def month_end_billing(month_yyyy_mm):
+    month_start, next_month_start = month_range(month_yyyy_mm)
+    params = (month_start, next_month_start)
     with get_conn() as conn:
-        deliveries = conn.execute(
-            """
-            SELECT dd.date, dd.quantity, dd.price,
-                   i.name AS item_name,
-                   dp.name AS partner_name
-            FROM daily_deliveries dd
-            JOIN items i ON i.id = dd.item_id
-            JOIN delivery_partners dp ON dp.id = dd.delivery_partner_id
-            WHERE dd.customer_id = ?
-              AND dd.date BETWEEN ? AND ?
-            ORDER BY dd.date
-            """,
-            (customer_id, start_date, end_date),
+        deliveries = conn.execute(BILLING_DELIVERY_SQL, params).fetchall()
+        paid = dict(conn.execute(BILLING_PAYMENT_SQL, params).fetchall())
+        opening = dict(conn.execute(OPENING_BALANCES_SQL, _opening_params(month_start)))
+        customers = conn.execute(
+            "SELECT id, name, active FROM customers ORDER BY name, id"
         ).fetchall()
-        payments = conn.execute(
-            """
-            SELECT date, amount, notes
-            FROM advance_payments
-            WHERE customer_id = ?
-              AND date BETWEEN ? AND ?
-            ORDER BY date
-            """,
-            (customer_id, start_date, end_date),
-        ).fetchall()
-        return deliveries, payments
+    item_names = {row["id"]: row["name"] for row in list_items()}
+
+    qty = {}
+    charges = {}
+    item_lines = {}
+    for customer_id, item_id, quantity, amount_paise in deliveries:
+        qty[customer_id] = qty.get(customer_id, 0) + quantity
+        charges[customer_id] = charges.get(customer_id, 0) + amount_paise
+        item_lines.setdefault(customer_id, []).append(
+            (item_names.get(item_id, ""), quantity, amount_paise)
+        )
+
+    bills = []
+    lines = []
+    for customer_id, name, active in customers:
+        charges_paise = charges.get(customer_id, 0)
+        paid_paise = paid.get(customer_id, 0)
+        opening_paise = opening.get(customer_id, 0)
+        if not (active or charges_paise or paid_paise or opening_paise):
+            continue
+        bills.append(
+            Bill(
+                customer_id,
+                name,
+                qty.get(customer_id, 0),
+                from_paise(charges_paise),
+                from_paise(paid_paise),
+                from_paise(opening_paise),
+                from_paise(opening_paise + charges_paise - paid_paise),
+            )
+        )
+        for item_name, quantity, amount_paise in sorted(item_lines.get(customer_id, ())):
+            lines.append(BillLine(customer_id, name, item_name, quantity, from_paise(amount_paise)))
+    return bills, lines
+
+
+def iter_statement_deliveries(start_date, end_date, customer_ids=None, chunk_size=None):
+    conditions, params = ["dd.date BETWEEN ? AND ?"], [start_date, end_date]
+    _customer_ids_condition("dd", conditions, params, customer_ids)
+    sql, params = _build_query(
+        STATEMENT_DELIVERY_SELECT, conditions, params, "dd.customer_id, dd.date, dd.id"
+    )
+    return _iter_query(sql, params, chunk_size)
+
+
+def iter_statement_payments(start_date, end_date, customer_ids=None, chunk_size=None):
+    conditions, params = ["ap.date BETWEEN ? AND ?"], [start_date, end_date]
+    _customer_ids_condition("ap", conditions, params, customer_ids)
+    sql, params = _build_query(
+        STATEMENT_PAYMENT_SELECT, conditions, params, "ap.customer_id, ap.date, ap.id"
+    )
+    return _iter_query(sql, params, chunk_size)
+
+
+ROUTE_CTE = """
+    WITH route AS (
+        SELECT customer_id, MIN(id) AS route_position
+        FROM daily_deliveries
+        WHERE delivery_partner_id = :partner_id AND date BETWEEN :start_date AND :end_date
+        GROUP BY customer_id
+    )
+"""
+
+RouteCustomer = _record_type("RouteCustomer", " ".join(Customer._fields) + " opening_paise")
+
+ROUTE_CUSTOMERS_SQL = f"""
+    {ROUTE_CTE}
+    SELECT {CUSTOMER_COLUMNS}, {CUSTOMER_OPENING_SQL.format(customer_id="r.customer_id")}
+    FROM route r
+    JOIN customers c ON c.id = r.customer_id
+    ORDER BY r.route_position
+"""
+
+ROUTE_DELIVERIES_SQL = f"""
+    {ROUTE_CTE}
+    {STATEMENT_DELIVERY_SELECT}
+    JOIN route r ON r.customer_id = dd.customer_id
+    WHERE dd.date BETWEEN :start_date AND :end_date
+    ORDER BY r.route_position, dd.date, dd.id
+"""
+
+ROUTE_PAYMENTS_SQL = f"""
+    {ROUTE_CTE}
+    {STATEMENT_PAYMENT_SELECT}
+    JOIN route r ON r.customer_id = ap.customer_id
+    WHERE ap.date BETWEEN :start_date AND :end_date
+    ORDER BY r.route_position, ap.date, ap.id
+"""
+
+
+def iter_route_statements(partner_id, start_date, end_date, chunk_size=None):
+    # Route order is the order the partner's deliveries were first entered in the
+    # period. The three streams share that order, so each customer's rows are
+    # collected by walking them in step and only one customer is held at a time.
+    # Opening balances come with the customer rows, and all three streams read
+    # from cursors on a single pooled connection.
+    params = {"partner_id": partner_id, "start_date": start_date, "end_date": end_date}
+    params.update(_opening_params(start_date))
+    with get_conn() as conn:
+        customers = _iter_cursor(conn, ROUTE_CUSTOMERS_SQL, params, chunk_size, RouteCustomer)
+        deliveries = _iter_cursor(conn, ROUTE_DELIVERIES_SQL, params, chunk_size)
+        payments = _iter_cursor(conn, ROUTE_PAYMENTS_SQL, params, chunk_size)
+        try:
+            next_delivery = next(deliveries, None)
+            next_payment = next(payments, None)
+            for row in customers:
+                customer = Customer._make(row[:-1])
+                customer_deliveries = []
+                while next_delivery is not None and next_delivery["customer_id"] == customer.id:
+                    customer_deliveries.append(next_delivery)
+                    next_delivery = next(deliveries, None)
+                customer_payments = []
+                while next_payment is not None and next_payment["customer_id"] == customer.id:
+                    customer_payments.append(next_payment)
+                    next_payment = next(payments, None)
+                yield customer, customer_deliveries, customer_payments, row.opening_paise
+        finally:
+            customers.close()
+            deliveries.close()
+            payments.close()
+
+
+LedgerEntry = _record_type(
+    "LedgerEntry",
+    "customer_id customer_name date entry description quantity charge payment balance",
+)
+
+LEDGER_SQL = f"""
+    WITH entries AS (
+        SELECT dd.customer_id, dd.date, 0 AS entry_order, dd.id AS entry_id,
+               'delivery' AS entry, i.name AS description, dd.quantity,
+               dd.quantity * dd.price_paise AS charge_paise, 0 AS paid_paise
+        FROM daily_deliveries dd
+        JOIN items i ON i.id = dd.item_id
+        WHERE dd.date BETWEEN :start_date AND :end_date
+        UNION ALL
+        SELECT ap.customer_id, ap.date, 1, ap.id, 'payment', COALESCE(ap.notes, ''), NULL,
+               0, ap.amount_paise
+        FROM advance_payments ap
+        WHERE ap.date BETWEEN :start_date AND :end_date
+    ),
+    opening AS ({OPENING_BALANCES_SQL})
+    SELECT e.customer_id, c.name AS customer_name, e.date, e.entry, e.description,
+           e.quantity,
+           e.charge_paise / 100.0 AS charge,
+           e.paid_paise / 100.0 AS payment,
+           (COALESCE(o.opening_paise, 0)
+            + SUM(e.charge_paise - e.paid_paise) OVER (
+                PARTITION BY e.customer_id
+                ORDER BY e.date, e.entry_order, e.entry_id
+                ROWS UNBOUNDED PRECEDING
+            )) / 100.0 AS balance
+    FROM entries e
+    JOIN customers c ON c.id = e.customer_id
+    LEFT JOIN opening o ON o.customer_id = e.customer_id
+    ORDER BY e.customer_id, e.date, e.entry_order, e.entry_id
+"""
+
+
+def iter_ledger(start_date=None, end_date=None, chunk_size=None):
+    start_date = start_date or "0000-01-01"
+    params = _opening_params(start_date)
+    params.update(start_date=start_date, end_date=end_date or "9999-12-31")
+    return _iter_query(LEDGER_SQL, params, chunk_size, LedgerEntry)
+
+
+EXPORTS = {
+    "deliveries": ("iter_daily_deliveries", Delivery),
+    "payments": ("iter_advance_payments", Payment),
+    "allocations": ("iter_partner_allocations", Allocation),
+    "ledger": ("iter_ledger", LedgerEntry),
+}
+EXPORT_FORMATS = ("csv", "jsonl")
+
+
+def export_rows(kind, handle, start_date=None, end_date=None, fmt="csv"):
+    if kind not in EXPORTS:
+        raise ValueError(f"Unknown export: {kind}")
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    iterator_name, record = EXPORTS[kind]
+    iterate = globals()[iterator_name]
+    fields = record._fields
+    count = 0
+    if fmt == "csv":
+        writer = csv.writer(handle)
+        writer.writerow(fields)
+        for row in iterate(start_date, end_date):
+            writer.writerow(row)
+            count += 1
+    else:
+        for row in iterate(start_date, end_date):
+            handle.write(json.dumps(dict(zip(fields, row)), ensure_ascii=False))
+            handle.write("\n")
+            count += 1
+    return count
+
+
+def export_to_file(kind, path, start_date=None, end_date=None, fmt="csv"):
+    with open(path, "w", newline="", encoding="utf-8") as handle:
+        return export_rows(kind, handle, start_date, end_date, fmt)
+
+
+StatementSummary = _record_type("StatementSummary", "total_qty charges paid opening closing")
 
 
 def customer_summary_range(customer_id, start_date, end_date):
@@ -601,7 +2270,7 @@ def customer_summary_range(customer_id, start_date, end_date):
             """
             SELECT
                 COALESCE(SUM(dd.quantity), 0) AS total_qty,
-                COALESCE(SUM(dd.quantity * dd.price), 0) AS total_amount
+                COALESCE(SUM(dd.quantity * dd.price_paise), 0) AS total_amount_paise
             FROM daily_deliveries dd
             WHERE dd.customer_id = ?
               AND dd.date BETWEEN ? AND ?
@@ -610,27 +2279,61 @@ def customer_summary_range(customer_id, start_date, end_date):
         ).fetchone()
         paid = conn.execute(
             """
-            SELECT COALESCE(SUM(ap.amount), 0) AS total_paid
+            SELECT COALESCE(SUM(ap.amount_paise), 0) AS total_paid_paise
             FROM advance_payments ap
             WHERE ap.customer_id = ?
               AND ap.date BETWEEN ? AND ?
             """,
             (customer_id, start_date, end_date),
         ).fetchone()
-        return totals["total_qty"], totals["total_amount"], paid["total_paid"]
+        opening_paise = _opening_balance_paise(conn, customer_id, start_date)
+        closing_paise = (
+            opening_paise + totals["total_amount_paise"] - paid["total_paid_paise"]
+        )
+        return StatementSummary(
+            totals["total_qty"],
+            from_paise(totals["total_amount_paise"]),
+            from_paise(paid["total_paid_paise"]),
+            from_paise(opening_paise),
+            from_paise(closing_paise),
+        )
 
 
 def get_customer(customer_id):
     with get_conn() as conn:
-        return conn.execute(
-            "SELECT * FROM customers WHERE id = ?", (customer_id,)
+        return _execute(
+            conn,
+            f"SELECT {CUSTOMER_COLUMNS} FROM customers c WHERE c.id = ?",
+            (customer_id,),
+            Customer,
         ).fetchone()
 
 
-def get_setting(key, default=None):
+_settings_cache = {}
+_settings_lock = threading.Lock()
+
+
+def _cached_settings():
+    pool = get_pool()
+    version = pool.data_version()
+    with _settings_lock:
+        cached = _settings_cache.get(pool.path)
+        if cached and cached[0] == version:
+            return cached[1]
     with get_conn() as conn:
-        row = conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
-        return row["value"] if row else default
+        rows = conn.execute("SELECT key, value FROM settings").fetchall()
+    values = {row["key"]: row["value"] for row in rows}
+    with _settings_lock:
+        _settings_cache[pool.path] = (version, values)
+    return values
+
+
+def get_settings():
+    return dict(_cached_settings())
+
+
+def get_setting(key, default=None):
+    return _cached_settings().get(key, default)
 
 
 def set_setting(key, value):
@@ -643,7 +2346,246 @@ def set_setting(key, value):
             """,
             (key, value),
         )
+    _after_commit(functools.partial(_drop_cached_settings, get_pool()))
+
+
+def _drop_cached_settings(pool):
+    with _settings_lock:
+        _settings_cache.pop(pool.path, None)
+
+
+def to_paise(rupees):
+    if rupees is None or rupees == "":
+        return None
+    amount = Decimal(str(rupees)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+    return int(amount * 100)
+
+
+def from_paise(paise):
+    if paise is None:
+        return None
+    return paise / 100
 
 
 def today_str():
     return date.today().strftime("%Y-%m-%d")
+
+
+_instrumented = {}
+_slow_query_ms = SLOW_QUERY_MS
+_call_stats = {}
+_slow_queries = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+_stats_lock = threading.Lock()
+_trace_state = threading.local()
+
+_UNINSTRUMENTED = {
+    "close_pool",
+    "close_pools",
+    "current_db_path",
+    "submit_write",
+    "write",
+    "enable_instrumentation",
+    "disable_instrumentation",
+    "from_paise",
+    "get_conn",
+    "get_pool",
+    "instrumentation_enabled",
+    "instrumentation_stats",
+    "month_range",
+    "query_plan",
+    "reset_instrumentation",
+    "set_slow_query_threshold",
+    "slow_queries",
+    "slow_query_threshold",
+    "to_paise",
+    "today_str",
+    "use_db_path",
+}
+
+
+def _trace_sql(statement):
+    frames = getattr(_trace_state, "frames", None)
+    if not frames:
+        return
+    now = time.perf_counter()
+    statements = frames[-1]
+    if statements and statements[-1][2] is None:
+        statements[-1][2] = now
+    statements.append([statement, now, None])
+
+
+def _result_rows(result):
+    if isinstance(result, (sqlite3.Row, _RecordMixin)):
+        return 1
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, tuple):
+        return sum(len(part) for part in result if isinstance(part, list))
+    return 0
+
+
+def _record_call(name, elapsed, rows, statements=(), finished=None):
+    slow = []
+    for statement, started, ended in statements:
+        duration_ms = ((ended or finished) - started) * 1000
+        if duration_ms >= _slow_query_ms:
+            slow.append((statement, duration_ms))
+    with _stats_lock:
+        stats = _call_stats.get(name)
+        if stats is None:
+            stats = _call_stats[name] = {
+                "calls": 0,
+                "total": 0.0,
+                "rows": 0,
+                "samples": deque(maxlen=STATS_SAMPLE_SIZE),
+            }
+        stats["calls"] += 1
+        stats["total"] += elapsed
+        stats["rows"] += rows
+        stats["samples"].append(elapsed)
+    for statement, duration_ms in slow:
+        _log_slow_query(name, statement, duration_ms)
+
+
+def _log_slow_query(name, statement, duration_ms):
+    plan = []
+    verb = statement.lstrip().split(None, 1)[0].upper()
+    if verb in ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE"):
+        try:
+            plan = get_pool().explain(statement)
+        except sqlite3.Error as exc:
+            plan = [f"plan unavailable: {exc}"]
+    logger.warning(
+        "Slow query in %s (%.1f ms): %s\n  %s",
+        name,
+        duration_ms,
+        " ".join(statement.split()),
+        "\n  ".join(plan),
+    )
+    _slow_queries.append(
+        {
+            "function": name,
+            "ms": round(duration_ms, 2),
+            "sql": " ".join(statement.split()),
+            "plan": plan,
+            "at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+    )
+
+
+def _instrumented_rows(name, rows_iter):
+    count = 0
+    elapsed = 0.0
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                row = next(rows_iter)
+            except StopIteration:
+                break
+            finally:
+                elapsed += time.perf_counter() - started
+            count += 1
+            yield row
+    finally:
+        rows_iter.close()
+        _record_call(name, elapsed, count)
+
+
+def _instrument(name, func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        frames = _trace_state.__dict__.setdefault("frames", [])
+        if frames and frames[-1] and frames[-1][-1][2] is None:
+            frames[-1][-1][2] = time.perf_counter()
+        statements = []
+        frames.append(statements)
+        started = time.perf_counter()
+        result = None
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            finished = time.perf_counter()
+            frames.pop()
+            if inspect.isgenerator(result):
+                result = _instrumented_rows(name, result)
+            else:
+                _record_call(
+                    name, finished - started, _result_rows(result), statements, finished
+                )
+        return result
+
+    return wrapper
+
+
+def enable_instrumentation(slow_query_ms=SLOW_QUERY_MS):
+    global _slow_query_ms
+    _slow_query_ms = slow_query_ms
+    if _instrumented:
+        return
+    module = globals()
+    for name, func in list(module.items()):
+        if (
+            inspect.isfunction(func)
+            and func.__module__ == __name__
+            and not name.startswith("_")
+            and name not in _UNINSTRUMENTED
+        ):
+            _instrumented[name] = func
+            module[name] = _instrument(name, func)
+
+
+def disable_instrumentation():
+    globals().update(_instrumented)
+    _instrumented.clear()
+
+
+def instrumentation_enabled():
+    return bool(_instrumented)
+
+
+def slow_query_threshold():
+    return _slow_query_ms
+
+
+def set_slow_query_threshold(slow_query_ms):
+    global _slow_query_ms
+    _slow_query_ms = slow_query_ms
+
+
+def reset_instrumentation():
+    with _stats_lock:
+        _call_stats.clear()
+        _slow_queries.clear()
+
+
+def instrumentation_stats():
+    with _stats_lock:
+        snapshot = [
+            (name, stats["calls"], stats["total"], stats["rows"], sorted(stats["samples"]))
+            for name, stats in _call_stats.items()
+        ]
+    results = []
+    for name, calls, total, rows, samples in snapshot:
+        p95 = samples[max(math.ceil(len(samples) * 0.95) - 1, 0)]
+        results.append(
+            {
+                "function": name,
+                "calls": calls,
+                "total_ms": round(total * 1000, 2),
+                "avg_ms": round(total * 1000 / calls, 3),
+                "p95_ms": round(p95 * 1000, 3),
+                "rows": rows,
+            }
+        )
+    results.sort(key=lambda row: row["total_ms"], reverse=True)
+    return results
+
+
+def slow_queries():
+    with _stats_lock:
+        return list(reversed(_slow_queries))
+
+
+if os.environ.get("MILK_DB_PROFILE"):
+    enable_instrumentation(float(os.environ.get("MILK_DB_SLOW_MS", SLOW_QUERY_MS)))
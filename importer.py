@@ -0,0 +1,300 @@
+import argparse
+import csv
+import io
+import os
+import sys
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+import db
+
+CHUNK_SIZE = 5000
+MAX_FIELD_LENGTH = 500
+
+IMPORT_KINDS = {
+    "customers": ("name", "contact", "address", "alt_contact"),
+    "partners": ("name", "contact", "address"),
+    "items": ("name", "price"),
+    "managers": ("name", "contact"),
+    "deliveries": ("date", "customer", "item", "quantity", "price", "partner", "manager"),
+    "payments": ("date", "customer", "amount", "notes"),
+}
+
+MASTER_TABLES = {
+    "customers": "customers",
+    "partners": "delivery_partners",
+    "items": "items",
+    "managers": "managers",
+}
+
+
+def _name_lookup(sql):
+    lookup = {}
+    ids = set()
+    with db.get_conn() as conn:
+        for row_id, name in conn.execute(sql):
+            key = (name or "").strip().casefold()
+            lookup[key] = None if key in lookup else row_id
+            ids.add(row_id)
+    return lookup, ids
+
+
+def load_lookups():
+    lookups = {
+        "customer": _name_lookup("SELECT id, name FROM customers WHERE active = 1"),
+        "partner": _name_lookup("SELECT id, name FROM delivery_partners WHERE active = 1"),
+        "item": _name_lookup("SELECT id, name FROM items"),
+        "manager": _name_lookup("SELECT id, name FROM managers"),
+    }
+    with db.get_conn() as conn:
+        lookups["item_price"] = dict(conn.execute("SELECT id, price_paise FROM items"))
+    return lookups
+
+
+def _text(row, field, required=False):
+    value = (row.get(field) or "").strip()
+    if required and not value:
+        raise ValueError(f"missing {field}")
+    if len(value) > MAX_FIELD_LENGTH:
+        raise ValueError(f"{field} is longer than {MAX_FIELD_LENGTH} characters")
+    return value
+
+
+def _resolve(row, field, lookups):
+    lookup, ids = lookups[field]
+    raw_id = (row.get(f"{field}_id") or "").strip()
+    if raw_id:
+        try:
+            row_id = int(raw_id)
+        except ValueError:
+            raise ValueError(f"{field}_id {raw_id!r} is not a number") from None
+        if row_id not in ids:
+            raise ValueError(f"unknown {field}_id {row_id}")
+        return row_id
+    name = _text(row, field, required=True)
+    key = name.casefold()
+    if key not in lookup:
+        raise ValueError(f"unknown {field} {name!r}")
+    if lookup[key] is None:
+        raise ValueError(f"{field} name {name!r} is ambiguous; use {field}_id")
+    return lookup[key]
+
+
+def _date(row):
+    value = _text(row, "date", required=True)
+    try:
+        return date.fromisoformat(value).strftime("%Y-%m-%d")
+    except ValueError:
+        raise ValueError(f"invalid date {value!r}, expected YYYY-MM-DD") from None
+
+
+def _amount(row, field, required=True):
+    value = _text(row, field, required=required)
+    if not value:
+        return None
+    try:
+        amount = Decimal(value.replace(",", ""))
+    except InvalidOperation:
+        raise ValueError(f"{field} {value!r} is not a number") from None
+    if not amount.is_finite() or amount < 0:
+        raise ValueError(f"{field} must be zero or more")
+    return str(amount)
+
+
+def _new_master_name(row, lookups, kind):
+    name = _text(row, "name", required=True)
+    seen = lookups.setdefault(f"new_{kind}", set())
+    key = name.casefold()
+    if key in seen:
+        raise ValueError(f"{kind[:-1]} {name!r} already exists")
+    seen.add(key)
+    return name
+
+
+def _parse_customer(row, lookups):
+    return (
+        _new_master_name(row, lookups, "customers"),
+        _text(row, "contact"),
+        _text(row, "address"),
+        _text(row, "alt_contact") or None,
+    )
+
+
+def _parse_partner(row, lookups):
+    return (
+        _new_master_name(row, lookups, "partners"),
+        _text(row, "contact"),
+        _text(row, "address"),
+    )
+
+
+def _parse_item(row, lookups):
+    return (_new_master_name(row, lookups, "items"), db.to_paise(_amount(row, "price")))
+
+
+def _parse_manager(row, lookups):
+    return (_new_master_name(row, lookups, "managers"), _text(row, "contact"))
+
+
+def _parse_delivery(row, lookups):
+    delivery_date = _date(row)
+    customer_id = _resolve(row, "customer", lookups)
+    item_id = _resolve(row, "item", lookups)
+    partner_id = _resolve(row, "partner", lookups)
+    manager_id = _resolve(row, "manager", lookups)
+    raw_quantity = _text(row, "quantity", required=True)
+    try:
+        quantity = int(raw_quantity)
+    except ValueError:
+        raise ValueError(f"quantity {raw_quantity!r} is not a whole number") from None
+    if quantity <= 0:
+        raise ValueError("quantity must be positive")
+    price = _amount(row, "price", required=False)
+    if price is None:
+        price = db.from_paise(lookups["item_price"][item_id])
+    return (delivery_date, customer_id, item_id, quantity, price, partner_id, manager_id)
+
+
+def _parse_payment(row, lookups):
+    payment_date = _date(row)
+    customer_id = _resolve(row, "customer", lookups)
+    amount = _amount(row, "amount")
+    if Decimal(amount) == 0:
+        raise ValueError("amount must be more than zero")
+    return (customer_id, amount, payment_date, _text(row, "notes"))
+
+
+PARSERS = {
+    "customers": _parse_customer,
+    "partners": _parse_partner,
+    "items": _parse_item,
+    "managers": _parse_manager,
+    "deliveries": _parse_delivery,
+    "payments": _parse_payment,
+}
+
+
+def _flush(kind, values, result):
+    if kind == "deliveries":
+        # Without the natural key several rounds may share a date, customer, item
+        # and partner, so there is no single row to update; every row is kept.
+        if db.delivery_natural_key_enabled():
+            inserted, updated = db.write(db.upsert_daily_deliveries_bulk, values)
+            result["imported"] += inserted
+            result["updated"] += updated
+        else:
+            result["imported"] += len(db.write(db.add_daily_deliveries_bulk, values))
+    elif kind == "payments":
+        result["imported"] += db.write(db.add_advance_payments_bulk, values)
+    else:
+        result["imported"] += db.write(db.add_masters_bulk, MASTER_TABLES[kind], values)
+
+
+def _seed_master_names(kind, lookups):
+    if kind not in MASTER_TABLES:
+        return
+    with db.get_conn() as conn:
+        names = conn.execute(f"SELECT name FROM {MASTER_TABLES[kind]}")
+        lookups[f"new_{kind}"] = {(name or "").strip().casefold() for (name,) in names}
+
+
+def import_csv(kind, handle, rejects_path=None, chunk_size=CHUNK_SIZE, progress=None):
+    if kind not in PARSERS:
+        raise ValueError(f"Unknown import kind: {kind}")
+    parse = PARSERS[kind]
+    reader = csv.DictReader(handle)
+    header = [name.strip().lower() for name in reader.fieldnames or []]
+    reader.fieldnames = header
+    if kind in MASTER_TABLES:
+        required = {"name"}
+    else:
+        required = set(IMPORT_KINDS[kind]) - {"price", "notes"}
+    missing = [
+        field
+        for field in sorted(required)
+        if field not in header and f"{field}_id" not in header
+    ]
+    if missing:
+        raise ValueError(f"CSV is missing columns: {', '.join(missing)}")
+
+    lookups = load_lookups()
+    _seed_master_names(kind, lookups)
+    result = {"processed": 0, "imported": 0, "updated": 0, "rejected": 0, "rejects_path": None}
+    rejects_file = None
+    rejects_writer = None
+    chunk = []
+    try:
+        for row in reader:
+            result["processed"] += 1
+            try:
+                chunk.append(parse(row, lookups))
+            except ValueError as exc:
+                if rejects_path:
+                    if rejects_writer is None:
+                        rejects_file = open(rejects_path, "w", newline="", encoding="utf-8")
+                        rejects_writer = csv.writer(rejects_file)
+                        rejects_writer.writerow(["line", *header, "error"])
+                        result["rejects_path"] = rejects_path
+                    rejects_writer.writerow(
+                        [reader.line_num, *(row.get(field) for field in header), str(exc)]
+                    )
+                result["rejected"] += 1
+            if len(chunk) >= chunk_size:
+                _flush(kind, chunk, result)
+                chunk = []
+                if progress:
+                    progress(result)
+        if chunk:
+            _flush(kind, chunk, result)
+    finally:
+        if rejects_file is not None:
+            rejects_file.close()
+    if progress:
+        progress(result)
+    return result
+
+
+def import_csv_bytes(kind, raw, rejects_path=None, chunk_size=CHUNK_SIZE, progress=None):
+    handle = io.TextIOWrapper(raw, encoding="utf-8-sig", newline="")
+    try:
+        return import_csv(kind, handle, rejects_path, chunk_size, progress)
+    finally:
+        handle.detach()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Import masters, deliveries or payments from CSV."
+    )
+    parser.add_argument("kind", choices=sorted(IMPORT_KINDS))
+    parser.add_argument("csv_path")
+    parser.add_argument("--db", default=db.DB_FILE, help="Database file to import into.")
+    parser.add_argument(
+        "--rejects", help="Where to write rejected rows (default: <csv>.rejects.csv)."
+    )
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    db.set_db_path(args.db)
+    rejects_path = args.rejects or f"{os.path.splitext(args.csv_path)[0]}.rejects.csv"
+
+    def report(result):
+        print(
+            f"\r{result['processed']} rows read, {result['imported']} imported, "
+            f"{result['updated']} updated, {result['rejected']} rejected",
+            end="",
+            file=sys.stderr,
+            flush=True,
+        )
+
+    with open(args.csv_path, newline="", encoding="utf-8-sig") as handle:
+        result = import_csv(args.kind, handle, rejects_path, args.chunk_size, report)
+    print(file=sys.stderr)
+    if result["rejects_path"]:
+        print(f"Rejected rows written to {result['rejects_path']}", file=sys.stderr)
+    db.close_pools()
+    return 1 if result["rejected"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
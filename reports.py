@@ -1,10 +1,24 @@
+import argparse
+import os
+import re
+import shutil
+import sys
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import date, timedelta
+
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import mm
 from reportlab.pdfgen import canvas
 
+import db
 
-def generate_customer_receipt(
-    output_path,
+RECEIPT_FETCH_CHUNK = 200
+RECEIPTS_IN_FLIGHT_PER_WORKER = 4
+
+
+def _draw_receipt(
+    c,
     shop_name,
     shop_address,
     shop_contact,
@@ -12,8 +26,8 @@ def generate_customer_receipt(
     month_label,
     deliveries,
     payments,
+    opening_paise,
 ):
-    c = canvas.Canvas(output_path, pagesize=A4)
     width, height = A4
 
     y = height - 20 * mm
@@ -53,15 +67,14 @@ def generate_customer_receipt(
     c.drawString(120 * mm, y, "Partner")
     y -= 4 * mm
 
-    total_amount = 0.0
+    total_paise = 0
     c.setFont("Helvetica", 9)
     for row in deliveries:
         if y < 25 * mm:
             c.showPage()
             y = height - 20 * mm
             c.setFont("Helvetica", 9)
-        amount = row["quantity"] * row["price"]
-        total_amount += amount
+        total_paise += row["quantity"] * row["price_paise"]
         c.drawString(20 * mm, y, row["date"])
         c.drawString(45 * mm, y, row["item_name"])
         c.drawString(85 * mm, y, str(row["quantity"]))
@@ -71,7 +84,7 @@ def generate_customer_receipt(
 
     y -= 6 * mm
     c.setFont("Helvetica-Bold", 10)
-    c.drawString(20 * mm, y, f"Total Charges: {total_amount:.2f}")
+    c.drawString(20 * mm, y, f"Total Charges: {total_paise / 100:.2f}")
 
     y -= 10 * mm
     c.drawString(20 * mm, y, "Advance Payments")
@@ -83,24 +96,305 @@ def generate_customer_receipt(
     y -= 4 * mm
     c.setFont("Helvetica", 9)
 
-    total_paid = 0.0
+    total_paid_paise = 0
     for row in payments:
         if y < 25 * mm:
             c.showPage()
             y = height - 20 * mm
             c.setFont("Helvetica", 9)
-        total_paid += row["amount"]
+        total_paid_paise += row["amount_paise"]
         c.drawString(20 * mm, y, row["date"])
         c.drawString(45 * mm, y, f"{row['amount']:.2f}")
         c.drawString(70 * mm, y, row["notes"] or "")
         y -= 4 * mm
 
     y -= 6 * mm
-    dues = total_amount - total_paid
+    closing_paise = opening_paise + total_paise - total_paid_paise
     c.setFont("Helvetica-Bold", 10)
-    c.drawString(20 * mm, y, f"Total Paid: {total_paid:.2f}")
+    c.drawString(20 * mm, y, f"Total Paid: {total_paid_paise / 100:.2f}")
+    y -= 8 * mm
+    if y < 40 * mm:
+        c.showPage()
+        y = height - 20 * mm
+        c.setFont("Helvetica-Bold", 10)
+    c.drawString(20 * mm, y, f"Opening Balance: {opening_paise / 100:.2f}")
     y -= 5 * mm
-    c.drawString(20 * mm, y, f"Dues: {dues:.2f}")
-
+    c.drawString(20 * mm, y, f"Period Charges: {total_paise / 100:.2f}")
+    y -= 5 * mm
+    c.drawString(20 * mm, y, f"Period Payments: {total_paid_paise / 100:.2f}")
+    y -= 5 * mm
+    c.drawString(20 * mm, y, f"Closing Balance: {closing_paise / 100:.2f}")
     c.showPage()
+
+
+def generate_customer_receipt(
+    output_path,
+    shop_name,
+    shop_address,
+    shop_contact,
+    customer,
+    month_label,
+    deliveries,
+    payments,
+    opening_paise=0,
+):
+    c = canvas.Canvas(output_path, pagesize=A4)
+    _draw_receipt(
+        c,
+        shop_name,
+        shop_address,
+        shop_contact,
+        customer,
+        month_label,
+        deliveries,
+        payments,
+        opening_paise,
+    )
+    c.save()
+
+
+def generate_route_receipts(
+    output_path,
+    shop_name,
+    shop_address,
+    shop_contact,
+    partner_id,
+    start_date,
+    end_date,
+    progress=None,
+):
+    # The canvas keeps every finished page until save(), so memory grows with
+    # the size of the PDF; compression keeps each page small.
+    c = canvas.Canvas(output_path, pagesize=A4, pageCompression=1)
+    label = f"{start_date} to {end_date}"
+    count = 0
+    for customer, deliveries, payments, opening_paise in db.iter_route_statements(
+        partner_id, start_date, end_date
+    ):
+        _draw_receipt(
+            c,
+            shop_name,
+            shop_address,
+            shop_contact,
+            customer,
+            label,
+            deliveries,
+            payments,
+            opening_paise,
+        )
+        count += 1
+        if progress:
+            progress(count)
     c.save()
+    return count
+
+
+def month_dates(month_yyyy_mm):
+    start_date, next_month_start = db.month_range(month_yyyy_mm)
+    end_date = date.fromisoformat(next_month_start) - timedelta(days=1)
+    return start_date, end_date.strftime("%Y-%m-%d")
+
+
+def receipt_file_name(customer):
+    slug = re.sub(r"[^A-Za-z0-9]+", "-", customer["name"] or "").strip("-").lower()
+    return f"{customer['id']}-{slug or 'customer'}.pdf"
+
+
+def _render_receipt(path, shop, customer, label, deliveries, payments, opening_paise):
+    part_path = f"{path}.part"
+    generate_customer_receipt(
+        part_path, *shop, customer, label, deliveries, payments, opening_paise=opening_paise
+    )
+    os.replace(part_path, path)
+
+
+def _iter_customer_statements(customers, start_date, end_date):
+    for offset in range(0, len(customers), RECEIPT_FETCH_CHUNK):
+        chunk = customers[offset:offset + RECEIPT_FETCH_CHUNK]
+        customer_ids = [customer["id"] for customer in chunk]
+        deliveries = {}
+        payments = {}
+        for row in db.iter_statement_deliveries(start_date, end_date, customer_ids):
+            deliveries.setdefault(row["customer_id"], []).append(dict(row))
+        for row in db.iter_statement_payments(start_date, end_date, customer_ids):
+            payments.setdefault(row["customer_id"], []).append(dict(row))
+        for customer in chunk:
+            yield customer, deliveries.get(customer["id"], []), payments.get(customer["id"], [])
+
+
+def _pack_receipts(render_dir, zip_path):
+    with zipfile.ZipFile(zip_path, "a", compression=zipfile.ZIP_DEFLATED) as archive:
+        packed = set(archive.namelist())
+        for name in sorted(os.listdir(render_dir)):
+            if name.endswith(".pdf") and name not in packed:
+                archive.write(os.path.join(render_dir, name), name)
+    shutil.rmtree(render_dir)
+
+
+def generate_batch_receipts(
+    output,
+    shop_name,
+    shop_address,
+    shop_contact,
+    start_date,
+    end_date,
+    customer_ids=None,
+    workers=None,
+    progress=None,
+    cancel=None,
+):
+    customers = db.list_customers(active_only=customer_ids is None)
+    if customer_ids is not None:
+        wanted = {int(customer_id) for customer_id in customer_ids}
+        customers = [customer for customer in customers if customer["id"] in wanted]
+
+    # Zip output is rendered into a side directory first, so an interrupted run
+    # leaves finished PDFs behind to resume from instead of a broken archive.
+    to_zip = output.lower().endswith(".zip")
+    render_dir = f"{output}.parts" if to_zip else output
+    os.makedirs(render_dir, exist_ok=True)
+    done = set(os.listdir(render_dir))
+    if to_zip and os.path.exists(output):
+        with zipfile.ZipFile(output) as archive:
+            done.update(archive.namelist())
+    pending = sorted(
+        (customer for customer in customers if receipt_file_name(customer) not in done),
+        key=lambda customer: customer["id"],
+    )
+    result = {
+        "customers": len(customers),
+        "skipped": len(customers) - len(pending),
+        "rendered": 0,
+        "cancelled": False,
+        "output": output,
+    }
+    if progress:
+        progress(result)
+
+    if pending:
+        shop = (shop_name, shop_address, shop_contact)
+        label = f"{start_date} to {end_date}"
+        opening = db.opening_balances_paise(start_date)
+        workers = workers or os.cpu_count() or 1
+
+        def collect(finished):
+            for future in finished:
+                future.result()
+                result["rendered"] += 1
+            if progress:
+                progress(result)
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            in_flight = set()
+            for customer, deliveries, payments in _iter_customer_statements(
+                pending, start_date, end_date
+            ):
+                if cancel is not None and cancel.is_set():
+                    result["cancelled"] = True
+                    break
+                if len(in_flight) >= workers * RECEIPTS_IN_FLIGHT_PER_WORKER:
+                    finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(finished)
+                in_flight.add(
+                    pool.submit(
+                        _render_receipt,
+                        os.path.join(render_dir, receipt_file_name(customer)),
+                        shop,
+                        customer._asdict(),
+                        label,
+                        deliveries,
+                        payments,
+                        opening.get(customer["id"], 0),
+                    )
+                )
+            collect(wait(in_flight).done)
+
+    if to_zip and not result["cancelled"]:
+        _pack_receipts(render_dir, output)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate PDF receipts for many customers.")
+    parser.add_argument("month", nargs="?", help="Month to bill, as YYYY-MM.")
+    parser.add_argument("--from", dest="start_date", help="Start date (YYYY-MM-DD).")
+    parser.add_argument("--to", dest="end_date", help="End date (YYYY-MM-DD).")
+    parser.add_argument(
+        "--output",
+        help="Directory or .zip file (default: receipts-<start>.zip), "
+        "or the PDF file with --partner (default: route-<partner>-<start>.pdf).",
+    )
+    parser.add_argument("--customers", help="Comma separated customer ids (default: all active).")
+    parser.add_argument(
+        "--partner", type=int, help="Write one PDF for this delivery partner's route instead."
+    )
+    parser.add_argument("--workers", type=int, help="Worker processes (default: one per core).")
+    parser.add_argument("--db", default=db.DB_FILE, help="Database file to read.")
+    args = parser.parse_args()
+
+    if args.month:
+        try:
+            start_date, end_date = month_dates(args.month)
+        except ValueError:
+            parser.error(f"invalid month {args.month!r}, expected YYYY-MM")
+    elif args.start_date and args.end_date:
+        start_date, end_date = args.start_date, args.end_date
+    else:
+        parser.error("give a month or both --from and --to")
+    customer_ids = None
+    if args.customers:
+        customer_ids = [int(value) for value in args.customers.split(",") if value.strip()]
+
+    db.set_db_path(args.db)
+    settings = db.get_settings()
+    shop = (
+        settings.get("shop_name", "Milk Billing System"),
+        settings.get("shop_address", ""),
+        settings.get("shop_contact", ""),
+    )
+
+    if args.partner is not None:
+        output = args.output or f"route-{args.partner}-{start_date}.pdf"
+        count = generate_route_receipts(
+            output,
+            *shop,
+            args.partner,
+            start_date,
+            end_date,
+            progress=lambda count: print(
+                f"\r{count} customers", end="", file=sys.stderr, flush=True
+            ),
+        )
+        print(file=sys.stderr)
+        print(f"{count} receipts written to {output}", file=sys.stderr)
+        db.close_pools()
+        return 0
+
+    output = args.output or f"receipts-{start_date}.zip"
+
+    def report(result):
+        print(
+            f"\r{result['rendered'] + result['skipped']}/{result['customers']} receipts "
+            f"({result['skipped']} already done)",
+            end="",
+            file=sys.stderr,
+            flush=True,
+        )
+
+    generate_batch_receipts(
+        output,
+        *shop,
+        start_date,
+        end_date,
+        customer_ids=customer_ids,
+        workers=args.workers,
+        progress=report,
+    )
+    print(file=sys.stderr)
+    print(f"Receipts written to {output}", file=sys.stderr)
+    db.close_pools()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,19 +1,26 @@
+import atexit
 import hashlib
 import hmac
+import io
 import os
+import shutil
+import sqlite3
 import tempfile
 from datetime import date
 
 import streamlit as st
 
+import billing
 import db
-from reports import generate_customer_receipt
+import importer
+from reports import generate_customer_receipt, generate_route_receipts
 
 
 APP_DIR = os.path.dirname(os.path.abspath(__file__))
 DEFAULT_DB = os.path.join(APP_DIR, "milk_billing.db")
 DEFAULT_USERNAME = "admin"
 DEFAULT_PASSWORD = "admin123"
+PAGE_SIZE = 200
 
 
 def to_date(value):
@@ -30,6 +37,23 @@ def rows_to_dicts(rows):
     return [dict(r) for r in rows]
 
 
+def keyset_page(key, fetch_page, page_size=PAGE_SIZE):
+    cursors_key = f"{key}_cursors"
+    if cursors_key not in st.session_state:
+        st.session_state[cursors_key] = [None]
+    cursors = st.session_state[cursors_key]
+    rows = fetch_page(after_id=cursors[-1], page_size=page_size)
+    prev_col, info_col, next_col = st.columns(3)
+    info_col.caption(f"Page {len(cursors)}")
+    if len(cursors) > 1 and prev_col.button("Previous page", key=f"{key}_prev"):
+        cursors.pop()
+        st.rerun()
+    if len(rows) == page_size and next_col.button("Next page", key=f"{key}_next"):
+        cursors.append(rows[-1]["id"])
+        st.rerun()
+    return rows
+
+
 def fmt_name(row, suffix_keys=("contact",)):
     suffix = None
     for key in suffix_keys:
@@ -46,17 +70,34 @@ def fmt_item(row):
 
 
 def set_db_path(path):
-    db.DB_FILE = path
-    db.init_db()
+    db.use_db_path(path)
+
+
+def replace_db_file(path, data):
+    temp_fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".upload")
+    try:
+        with os.fdopen(temp_fd, "wb") as f:
+            f.write(data)
+        db.close_pool(path)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    for suffix in ("-wal", "-shm", "-journal"):
+        try:
+            os.remove(path + suffix)
+        except FileNotFoundError:
+            pass
 
 
 def load_settings():
+    stored = db.get_settings()
     return {
-        "shop_name": db.get_setting("shop_name", "Milk Billing System"),
-        "shop_address": db.get_setting("shop_address", ""),
-        "shop_contact": db.get_setting("shop_contact", ""),
-        "app_username": db.get_setting("app_username", DEFAULT_USERNAME),
-        "app_password_hash": db.get_setting("app_password_hash", ""),
+        "shop_name": stored.get("shop_name", "Milk Billing System"),
+        "shop_address": stored.get("shop_address", ""),
+        "shop_contact": stored.get("shop_contact", ""),
+        "app_username": stored.get("app_username", DEFAULT_USERNAME),
+        "app_password_hash": stored.get("app_password_hash", ""),
     }
 
 
@@ -119,8 +160,7 @@ def sidebar_data_access():
         upload_dir = os.path.join(APP_DIR, "uploaded")
         os.makedirs(upload_dir, exist_ok=True)
         uploaded_path = os.path.join(upload_dir, "milk_billing.db")
-        with open(uploaded_path, "wb") as f:
-            f.write(uploaded.getbuffer())
+        replace_db_file(uploaded_path, uploaded.getbuffer())
         st.session_state.db_path = uploaded_path
         st.sidebar.success("Uploaded database is now in use.")
         st.rerun()
@@ -150,7 +190,7 @@ def render_masters_tab():
     with customers_tab:
         st.markdown("### Customers")
         search = st.text_input("Search", "")
-        customer_rows = rows_to_dicts(db.list_customers_with_balance(search))
+        customer_rows = db.list_customers_with_balance(search)
         st.dataframe(customer_rows, use_container_width=True)
 
         with st.expander("Add Customer", expanded=False):
@@ -164,11 +204,17 @@ def render_masters_tab():
                 if not name.strip():
                     st.error("Customer name is required.")
                 else:
-                    db.add_customer(name.strip(), contact.strip(), address.strip(), alt_contact.strip())
+                    db.write(
+                        db.add_customer,
+                        name.strip(),
+                        contact.strip(),
+                        address.strip(),
+                        alt_contact.strip(),
+                    )
                     st.success("Customer added.")
                     st.rerun()
 
-        active_customers = rows_to_dicts(db.list_customers())
+        active_customers = db.list_customers()
         if active_customers:
             selection = st.selectbox(
                 "Select customer to update/delete",
@@ -188,7 +234,8 @@ def render_masters_tab():
                 if not name.strip():
                     st.error("Customer name is required.")
                 else:
-                    db.update_customer(
+                    db.write(
+                        db.update_customer,
                         selection["id"],
                         name.strip(),
                         contact.strip(),
@@ -199,7 +246,7 @@ def render_masters_tab():
                     st.rerun()
 
             if st.button("Delete Customer", key="delete_customer"):
-                db.deactivate_customer(selection["id"])
+                db.write(db.deactivate_customer, selection["id"])
                 st.success("Customer deleted.")
                 st.rerun()
 
@@ -218,7 +265,12 @@ def render_masters_tab():
                 if not name.strip():
                     st.error("Partner name is required.")
                 else:
-                    db.add_delivery_partner(name.strip(), contact.strip(), address.strip())
+                    db.write(
+                        db.add_delivery_partner,
+                        name.strip(),
+                        contact.strip(),
+                        address.strip(),
+                    )
                     st.success("Partner added.")
                     st.rerun()
 
@@ -239,14 +291,15 @@ def render_masters_tab():
                 if not name.strip():
                     st.error("Partner name is required.")
                 else:
-                    db.update_delivery_partner(
+                    db.write(
+                        db.update_delivery_partner,
                         selection["id"], name.strip(), contact.strip(), address.strip()
                     )
                     st.success("Partner updated.")
                     st.rerun()
 
             if st.button("Delete Partner", key="delete_partner"):
-                db.deactivate_delivery_partner(selection["id"])
+                db.write(db.deactivate_delivery_partner, selection["id"])
                 st.success("Partner deleted.")
                 st.rerun()
 
@@ -264,7 +317,7 @@ def render_masters_tab():
                 if not name.strip():
                     st.error("Item name is required.")
                 else:
-                    db.add_item(name.strip(), float(price))
+                    db.write(db.add_item, name.strip(), float(price))
                     st.success("Item added.")
                     st.rerun()
 
@@ -286,12 +339,12 @@ def render_masters_tab():
                 if not name.strip():
                     st.error("Item name is required.")
                 else:
-                    db.update_item(selection["id"], name.strip(), float(price))
+                    db.write(db.update_item, selection["id"], name.strip(), float(price))
                     st.success("Item updated.")
                     st.rerun()
 
             if st.button("Delete Item", key="delete_item"):
-                db.delete_item(selection["id"])
+                db.write(db.delete_item, selection["id"])
                 st.success("Item deleted.")
                 st.rerun()
 
@@ -309,7 +362,7 @@ def render_masters_tab():
                 if not name.strip():
                     st.error("Manager name is required.")
                 else:
-                    db.add_manager(name.strip(), contact.strip())
+                    db.write(db.add_manager, name.strip(), contact.strip())
                     st.success("Manager added.")
                     st.rerun()
 
@@ -329,12 +382,12 @@ def render_masters_tab():
                 if not name.strip():
                     st.error("Manager name is required.")
                 else:
-                    db.update_manager(selection["id"], name.strip(), contact.strip())
+                    db.write(db.update_manager, selection["id"], name.strip(), contact.strip())
                     st.success("Manager updated.")
                     st.rerun()
 
             if st.button("Delete Manager", key="delete_manager"):
-                db.delete_manager(selection["id"])
+                db.write(db.delete_manager, selection["id"])
                 st.success("Manager deleted.")
                 st.rerun()
 
@@ -359,26 +412,64 @@ def render_masters_tab():
                     if new_password != confirm_password:
                         st.error("Passwords do not match.")
                         return
-                    db.set_setting("app_password_hash", hash_password(new_password))
+                    db.write(db.set_setting, "app_password_hash", hash_password(new_password))
                 if app_username.strip():
-                    db.set_setting("app_username", app_username.strip())
-                db.set_setting("shop_name", shop_name.strip())
-                db.set_setting("shop_address", shop_address.strip())
-                db.set_setting("shop_contact", shop_contact.strip())
+                    db.write(db.set_setting, "app_username", app_username.strip())
+                db.write(db.set_setting, "shop_name", shop_name.strip())
+                db.write(db.set_setting, "shop_address", shop_address.strip())
+                db.write(db.set_setting, "shop_contact", shop_contact.strip())
                 st.success("Settings saved.")
                 st.rerun()
 
         if settings.get("app_password_hash"):
             if st.button("Remove App Password", key="remove_app_password"):
-                db.set_setting("app_password_hash", "")
+                db.write(db.set_setting, "app_password_hash", "")
                 st.session_state.authenticated = False
                 st.success("Password removed.")
                 st.rerun()
 
+        if st.query_params.get("debug") == "1":
+            with st.expander("Database Stats", expanded=False):
+                render_db_stats()
+
+
+def toggle_db_stats():
+    if st.session_state.db_stats_enabled:
+        db.enable_instrumentation(st.session_state.db_stats_slow_ms)
+    else:
+        db.disable_instrumentation()
+
+
+def set_db_stats_threshold():
+    db.set_slow_query_threshold(st.session_state.db_stats_slow_ms)
+
+
+def render_db_stats():
+    # Instrumentation is process-wide, so the widgets show the live state and
+    # only change it when the user does.
+    st.session_state.db_stats_enabled = db.instrumentation_enabled()
+    st.session_state.db_stats_slow_ms = float(db.slow_query_threshold())
+    st.checkbox("Record query timings", key="db_stats_enabled", on_change=toggle_db_stats)
+    st.number_input(
+        "Slow query threshold (ms)",
+        min_value=1.0,
+        step=10.0,
+        key="db_stats_slow_ms",
+        on_change=set_db_stats_threshold,
+    )
+    st.caption("Timings are recorded for every session on this server while enabled.")
+    if st.button("Reset Stats", key="db_stats_reset"):
+        db.reset_instrumentation()
+    st.dataframe(db.instrumentation_stats(), use_container_width=True)
+    st.markdown("#### Slow Queries")
+    for entry in db.slow_queries():
+        st.caption(f"{entry['at']} · {entry['function']} · {entry['ms']} ms")
+        st.code("\n".join([entry["sql"], *entry["plan"]]), language="sql")
+
 
 def render_daily_delivery_tab():
     st.subheader("Daily Delivery")
-    customers = rows_to_dicts(db.list_customers())
+    customers = db.list_customers()
     partners = rows_to_dicts(db.list_delivery_partners())
     items = rows_to_dicts(db.list_items())
     managers = rows_to_dicts(db.list_managers())
@@ -398,23 +489,97 @@ def render_daily_delivery_tab():
             if not all([customer, item, partner, manager]):
                 st.error("Please fill all delivery fields.")
             else:
-                db.add_daily_delivery(
-                    date_to_str(delivery_date),
+                try:
+                    db.write(
+                        db.add_daily_delivery,
+                        date_to_str(delivery_date),
+                        customer["id"],
+                        item["id"],
+                        int(quantity),
+                        float(item["price"]),
+                        partner["id"],
+                        manager["id"],
+                    )
+                except sqlite3.IntegrityError:
+                    st.error(
+                        "A delivery for this customer, item and partner already exists on that date."
+                    )
+                else:
+                    st.success("Delivery recorded.")
+                    st.rerun()
+
+    with st.expander("Standing Orders", expanded=False):
+        today = to_date(db.today_str())
+        generate_range = st.date_input(
+            "Generate For Dates", value=(today, today), key="standing_generate_range"
+        )
+        if st.button("Generate Deliveries", key="standing_generate"):
+            if not isinstance(generate_range, tuple) or len(generate_range) != 2:
+                st.error("Pick a start and end date.")
+            else:
+                created = db.write(
+                    db.generate_standing_deliveries,
+                    date_to_str(generate_range[0]),
+                    date_to_str(generate_range[1]),
+                )
+                st.success(f"{created} deliveries generated.")
+
+        with st.form("add_standing_order_form"):
+            customer = st.selectbox(
+                "Customer", options=customers, format_func=fmt_name, key="standing_customer"
+            )
+            item = st.selectbox("Item", options=items, format_func=fmt_item, key="standing_item")
+            quantity = st.number_input("Quantity", min_value=1, step=1, value=1, key="standing_qty")
+            partner = st.selectbox(
+                "Delivery Partner", options=partners, format_func=fmt_name, key="standing_partner"
+            )
+            manager = st.selectbox(
+                "Manager", options=managers, format_func=fmt_name, key="standing_manager"
+            )
+            start_date = st.date_input(
+                "Start Date", value=to_date(db.today_str()), key="standing_start"
+            )
+            has_end_date = st.checkbox("Has end date", value=False)
+            end_date = st.date_input("End Date", value=to_date(db.today_str()), key="standing_end")
+            submitted = st.form_submit_button("Save Standing Order")
+        if submitted:
+            if not all([customer, item, partner, manager]):
+                st.error("Please fill all standing order fields.")
+            else:
+                db.write(
+                    db.add_standing_order,
                     customer["id"],
                     item["id"],
                     int(quantity),
-                    float(item["price"]),
                     partner["id"],
                     manager["id"],
+                    date_to_str(end_date) if has_end_date else None,
+                    date_to_str(start_date),
                 )
-                st.success("Delivery recorded.")
+                st.success("Standing order saved.")
+                st.rerun()
+
+        standing_orders = rows_to_dicts(db.list_standing_orders())
+        st.dataframe(standing_orders, use_container_width=True)
+        if standing_orders:
+            selection = st.selectbox(
+                "Select standing order",
+                options=standing_orders,
+                format_func=lambda r: f"{r['customer_name']} - {r['item_name']} ({r['quantity']})",
+                key="standing_select",
+            )
+            if st.button("Stop Standing Order", key="standing_deactivate"):
+                db.write(db.deactivate_standing_order, selection["id"])
+                st.success("Standing order stopped.")
                 st.rerun()
 
     st.markdown("### Update / Delete Delivery")
     filter_date = st.date_input("Filter Date", value=to_date(db.today_str()), key="delivery_filter")
     show_all = st.checkbox("Show all deliveries", value=False)
-    deliveries = rows_to_dicts(
-        db.list_daily_deliveries(None if show_all else date_to_str(filter_date))
+    delivery_filter = None if show_all else date_to_str(filter_date)
+    deliveries = keyset_page(
+        f"deliveries_{delivery_filter}",
+        lambda **page: db.list_daily_deliveries(delivery_filter, **page),
     )
     st.dataframe(deliveries, use_container_width=True)
     if deliveries:
@@ -468,21 +633,28 @@ def render_daily_delivery_tab():
             )
             updated = st.form_submit_button("Update Delivery")
         if updated:
-            db.update_daily_delivery(
-                selection["id"],
-                date_to_str(delivery_date),
-                customer["id"],
-                item["id"],
-                int(quantity),
-                float(item["price"]),
-                partner["id"],
-                manager["id"],
-            )
-            st.success("Delivery updated.")
-            st.rerun()
+            try:
+                db.write(
+                    db.update_daily_delivery,
+                    selection["id"],
+                    date_to_str(delivery_date),
+                    customer["id"],
+                    item["id"],
+                    int(quantity),
+                    float(item["price"]),
+                    partner["id"],
+                    manager["id"],
+                )
+            except sqlite3.IntegrityError:
+                st.error(
+                    "A delivery for this customer, item and partner already exists on that date."
+                )
+            else:
+                st.success("Delivery updated.")
+                st.rerun()
 
         if st.button("Delete Delivery", key="delete_delivery"):
-            db.delete_daily_delivery(selection["id"])
+            db.write(db.delete_daily_delivery, selection["id"])
             st.success("Delivery deleted.")
             st.rerun()
 
@@ -499,7 +671,13 @@ def render_daily_delivery_tab():
             if not customer:
                 st.error("Customer is required.")
             else:
-                db.add_advance_payment(customer["id"], float(amount), date_to_str(payment_date), notes.strip())
+                db.write(
+                    db.add_advance_payment,
+                    customer["id"],
+                    float(amount),
+                    date_to_str(payment_date),
+                    notes.strip(),
+                )
                 st.success("Payment recorded.")
                 st.rerun()
 
@@ -508,8 +686,10 @@ def render_daily_delivery_tab():
         "Filter Date", value=to_date(db.today_str()), key="payment_filter"
     )
     show_all_payments = st.checkbox("Show all payments", value=False)
-    payments = rows_to_dicts(
-        db.list_advance_payments(None if show_all_payments else date_to_str(payment_filter))
+    payment_date = None if show_all_payments else date_to_str(payment_filter)
+    payments = keyset_page(
+        f"payments_{payment_date}",
+        lambda **page: db.list_advance_payments(payment_date, **page),
     )
     st.dataframe(payments, use_container_width=True)
     if payments:
@@ -539,7 +719,8 @@ def render_daily_delivery_tab():
             notes = st.text_input("Notes", value=selection.get("notes") or "")
             updated = st.form_submit_button("Update Payment")
         if updated:
-            db.update_advance_payment(
+            db.write(
+                db.update_advance_payment,
                 selection["id"],
                 customer["id"],
                 float(amount),
@@ -550,7 +731,7 @@ def render_daily_delivery_tab():
             st.rerun()
 
         if st.button("Delete Payment", key="delete_payment"):
-            db.delete_advance_payment(selection["id"])
+            db.write(db.delete_advance_payment, selection["id"])
             st.success("Payment deleted.")
             st.rerun()
 
@@ -573,7 +754,8 @@ def render_partner_stock_tab():
             if not all([partner, manager, item]):
                 st.error("Please fill all allocation fields.")
             else:
-                db.add_partner_allocation(
+                db.write(
+                    db.add_partner_allocation,
                     date_to_str(allocation_date),
                     partner["id"],
                     manager["id"],
@@ -588,8 +770,10 @@ def render_partner_stock_tab():
         "Filter Date", value=to_date(db.today_str()), key="alloc_filter"
     )
     show_all_alloc = st.checkbox("Show all allocations", value=False)
-    allocations = rows_to_dicts(
-        db.list_partner_allocations_all(None if show_all_alloc else date_to_str(alloc_filter))
+    allocation_date = None if show_all_alloc else date_to_str(alloc_filter)
+    allocations = keyset_page(
+        f"allocations_{allocation_date}",
+        lambda **page: db.list_partner_allocations_all(allocation_date, **page),
     )
     st.dataframe(allocations, use_container_width=True)
     if allocations:
@@ -635,7 +819,8 @@ def render_partner_stock_tab():
             )
             updated = st.form_submit_button("Update Allocation")
         if updated:
-            db.update_partner_allocation(
+            db.write(
+                db.update_partner_allocation,
                 selection["id"],
                 date_to_str(allocation_date),
                 partner["id"],
@@ -647,7 +832,7 @@ def render_partner_stock_tab():
             st.rerun()
 
         if st.button("Delete Allocation", key="delete_allocation"):
-            db.delete_partner_allocation(selection["id"])
+            db.write(db.delete_partner_allocation, selection["id"])
             st.success("Allocation deleted.")
             st.rerun()
 
@@ -684,10 +869,40 @@ def render_partner_stock_tab():
             lines.append(f"Remaining packets: {remaining}")
             st.text("\n".join(lines))
 
+    st.divider()
+    st.markdown("### Day Stock Position")
+    position_date = st.date_input(
+        "Stock Date", value=to_date(db.today_str()), key="stock_position_date"
+    )
+    position_rows = db.partner_reconciliation(date_to_str(position_date))
+    if position_rows:
+        st.dataframe(
+            [
+                {
+                    "partner": row["partner_name"],
+                    "item": row["item_name"],
+                    "allocated": row["allocated"],
+                    "delivered": row["delivered"],
+                    "remaining": row["remaining"],
+                }
+                for row in position_rows
+            ],
+            use_container_width=True,
+            column_config={
+                "partner": st.column_config.TextColumn("Partner"),
+                "item": st.column_config.TextColumn("Item"),
+                "allocated": st.column_config.NumberColumn("Allocated"),
+                "delivered": st.column_config.NumberColumn("Delivered"),
+                "remaining": st.column_config.NumberColumn("Remaining"),
+            },
+        )
+    else:
+        st.info("No allocations or deliveries for this date.")
+
 
 def render_reports_tab():
     st.subheader("Reports")
-    customers = rows_to_dicts(db.list_customers())
+    customers = db.list_customers()
     settings = load_settings()
 
     st.markdown("### Customer Summary")
@@ -696,18 +911,19 @@ def render_reports_tab():
         start_date = st.date_input("From Date", value=to_date(db.today_str()), key="report_from")
         end_date = st.date_input("To Date", value=to_date(db.today_str()), key="report_to")
         if st.button("Load Summary", key="report_load_summary"):
-            total_qty, total_amount, total_paid = db.customer_summary_range(
+            summary = db.customer_summary_range(
                 customer["id"], date_to_str(start_date), date_to_str(end_date)
             )
-            balance = total_amount - total_paid
-            dues = balance if balance > 0 else 0.0
-            credit = -balance if balance < 0 else 0.0
+            dues = summary.closing if summary.closing > 0 else 0.0
+            credit = -summary.closing if summary.closing < 0 else 0.0
             lines = [
                 f"Customer: {customer['name']}",
                 f"Date Range: {date_to_str(start_date)} to {date_to_str(end_date)}",
-                f"Total Qty: {total_qty}",
-                f"Total Amount: {total_amount:.2f}",
-                f"Total Paid: {total_paid:.2f}",
+                f"Total Qty: {summary.total_qty}",
+                f"Opening Balance: {summary.opening:.2f}",
+                f"Period Charges: {summary.charges:.2f}",
+                f"Period Payments: {summary.paid:.2f}",
+                f"Closing Balance: {summary.closing:.2f}",
                 f"Dues: {dues:.2f}    Credit: {credit:.2f}",
             ]
             st.text("\n".join(lines))
@@ -728,6 +944,9 @@ def render_reports_tab():
                 f"{date_to_str(start_date)} to {date_to_str(end_date)}",
                 deliveries,
                 payments,
+                opening_paise=db.customer_opening_balance_paise(
+                    customer["id"], date_to_str(start_date)
+                ),
             )
             with open(preview_path, "rb") as f:
                 pdf_bytes = f.read()
@@ -738,6 +957,144 @@ def render_reports_tab():
                 mime="application/pdf",
             )
 
+    st.markdown("### Month-End Billing")
+    today = to_date(db.today_str())
+    year_col, month_col = st.columns(2)
+    year = year_col.selectbox(
+        "Year", options=list(range(today.year - 2, today.year + 3)), index=2, key="billing_year"
+    )
+    month = month_col.selectbox(
+        "Month", options=list(range(1, 13)), index=today.month - 1, key="billing_month"
+    )
+    if st.button("Run Billing", key="billing_run"):
+        month_value = f"{year}-{month:02d}"
+        bills, lines = db.month_end_billing(month_value)
+        totals = billing.billing_totals(bills)
+        st.caption(
+            f"{totals['customers']} customers, qty {totals['qty']}, "
+            f"charges {totals['amount']:.2f}, paid {totals['paid']:.2f}, "
+            f"due {totals['due']:.2f}"
+        )
+        st.dataframe(
+            bills,
+            use_container_width=True,
+            column_order=("customer_name", "qty", "opening", "amount", "paid", "due"),
+            column_config={
+                "customer_name": st.column_config.TextColumn("Customer"),
+                "qty": st.column_config.NumberColumn("Qty"),
+                "opening": st.column_config.NumberColumn("Opening", format="₹%.2f"),
+                "amount": st.column_config.NumberColumn("Charges", format="₹%.2f"),
+                "paid": st.column_config.NumberColumn("Paid", format="₹%.2f"),
+                "due": st.column_config.NumberColumn("Due", format="₹%.2f"),
+            },
+        )
+        bills_csv = io.StringIO()
+        billing.write_bills(bills_csv, bills)
+        lines_csv = io.StringIO()
+        billing.write_bill_lines(lines_csv, lines)
+        download_col, lines_col = st.columns(2)
+        download_col.download_button(
+            "Download Bills",
+            data=bills_csv.getvalue(),
+            file_name=f"bills-{month_value}.csv",
+            mime="text/csv",
+            key="billing_download",
+        )
+        lines_col.download_button(
+            "Download Item Lines",
+            data=lines_csv.getvalue(),
+            file_name=f"bill-lines-{month_value}.csv",
+            mime="text/csv",
+            key="billing_lines_download",
+        )
+
+    st.markdown("### Route Receipts (PDF)")
+    partners = rows_to_dicts(db.list_delivery_partners())
+    if partners:
+        partner = st.selectbox(
+            "Delivery Partner", options=partners, format_func=fmt_name, key="route_partner"
+        )
+        default_date = to_date(db.today_str())
+        route_range = st.date_input(
+            "Date Range", value=(default_date.replace(day=1), default_date), key="route_range"
+        )
+        if st.button("Generate Route PDF", key="route_generate"):
+            if not isinstance(route_range, tuple) or len(route_range) != 2:
+                st.error("Pick a start and end date.")
+                return
+            start_date, end_date = (date_to_str(value) for value in route_range)
+            route_path = prepare_download(
+                "route_file", f"route-{partner['name']}-{start_date}.pdf"
+            )
+            with st.spinner("Generating receipts..."):
+                count = generate_route_receipts(
+                    route_path,
+                    settings["shop_name"],
+                    settings["shop_address"],
+                    settings["shop_contact"],
+                    partner["id"],
+                    start_date,
+                    end_date,
+                )
+            if not count:
+                discard_download("route_file")
+                st.info("No deliveries by this partner in the date range.")
+                return
+            st.session_state.route_file["count"] = count
+        route = st.session_state.get("route_file")
+        if route and os.path.exists(route["path"]):
+            st.caption(f"{route['count']} customers")
+            download_col, discard_col = st.columns(2)
+            with open(route["path"], "rb") as f:
+                download_col.download_button(
+                    "Download Route PDF",
+                    data=f,
+                    file_name=route["file_name"],
+                    mime="application/pdf",
+                    key="route_download",
+                )
+            if discard_col.button("Discard Route PDF", key="route_discard"):
+                discard_download("route_file")
+                st.rerun()
+
+
+def remove_download_dirs(dirs):
+    for temp_dir in list(dirs):
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    dirs.clear()
+
+
+# Streamlit re-runs this script on every interaction, so the tracked set lives
+# in a cached resource: one set, and one exit handler, per server process.
+@st.cache_resource
+def download_dirs():
+    dirs = set()
+    atexit.register(remove_download_dirs, dirs)
+    return dirs
+
+
+def discard_download(key):
+    previous = st.session_state.pop(key, None)
+    if previous:
+        shutil.rmtree(previous["dir"], ignore_errors=True)
+        download_dirs().discard(previous["dir"])
+
+
+def prepare_download(key, file_name):
+    discard_download(key)
+    temp_dir = tempfile.mkdtemp()
+    download_dirs().add(temp_dir)
+    path = os.path.join(temp_dir, file_name)
+    st.session_state[key] = {"dir": temp_dir, "path": path, "file_name": file_name}
+    return path
+
+
+def list_date_bounds(date_range, show_all):
+    if show_all or not isinstance(date_range, tuple) or len(date_range) != 2:
+        return None, None
+    start_date, end_date = date_range
+    return date_to_str(start_date), date_to_str(end_date)
+
 
 def render_lists_tab():
     st.subheader("Lists")
@@ -753,35 +1110,31 @@ def render_lists_tab():
             key="list_deliveries_date_range",
         )
         show_all = st.checkbox("Show all deliveries", value=False, key="list_deliveries_all")
-        rows = rows_to_dicts(db.list_daily_deliveries())
-        if not show_all and isinstance(date_range, tuple) and len(date_range) == 2:
-            start_date, end_date = date_range
-            rows = [
-                row
-                for row in rows
-                if date_to_str(start_date) <= row["date"] <= date_to_str(end_date)
-            ]
-        display_rows = [
-            {
-                "date": row["date"],
-                "customer": row["customer_name"],
-                "item": row["item_name"],
-                "qty": row["quantity"],
-                "partner": row["partner_name"],
-                "manager": row["manager_name"],
-            }
-            for row in rows
-        ]
+        start_date, end_date = list_date_bounds(date_range, show_all)
+        rows = keyset_page(
+            f"list_deliveries_{start_date}_{end_date}",
+            lambda after_id, page_size: db.list_daily_deliveries_range(
+                start_date, end_date, limit=page_size, after_id=after_id
+            ),
+        )
         st.dataframe(
-            display_rows,
+            rows,
             use_container_width=True,
+            column_order=(
+                "date",
+                "customer_name",
+                "item_name",
+                "quantity",
+                "partner_name",
+                "manager_name",
+            ),
             column_config={
                 "date": st.column_config.TextColumn("Date", width="medium"),
-                "customer": st.column_config.TextColumn("Customer"),
-                "item": st.column_config.TextColumn("Item"),
-                "qty": st.column_config.NumberColumn("Qty"),
-                "partner": st.column_config.TextColumn("Partner"),
-                "manager": st.column_config.TextColumn("Manager"),
+                "customer_name": st.column_config.TextColumn("Customer"),
+                "item_name": st.column_config.TextColumn("Item"),
+                "quantity": st.column_config.NumberColumn("Qty"),
+                "partner_name": st.column_config.TextColumn("Partner"),
+                "manager_name": st.column_config.TextColumn("Manager"),
             },
         )
 
@@ -793,29 +1146,20 @@ def render_lists_tab():
             key="list_payments_date_range",
         )
         show_all = st.checkbox("Show all payments", value=False, key="list_payments_all")
-        rows = rows_to_dicts(db.list_advance_payments())
-        if not show_all and isinstance(date_range, tuple) and len(date_range) == 2:
-            start_date, end_date = date_range
-            rows = [
-                row
-                for row in rows
-                if date_to_str(start_date) <= row["date"] <= date_to_str(end_date)
-            ]
-        display_rows = [
-            {
-                "date": row["date"],
-                "customer": row["customer_name"],
-                "amount": row["amount"],
-                "notes": row.get("notes") or "",
-            }
-            for row in rows
-        ]
+        start_date, end_date = list_date_bounds(date_range, show_all)
+        rows = keyset_page(
+            f"list_payments_{start_date}_{end_date}",
+            lambda after_id, page_size: db.list_advance_payments_range(
+                start_date, end_date, limit=page_size, after_id=after_id
+            ),
+        )
         st.dataframe(
-            display_rows,
+            rows,
             use_container_width=True,
+            column_order=("date", "customer_name", "amount", "notes"),
             column_config={
                 "date": st.column_config.TextColumn("Date", width="medium"),
-                "customer": st.column_config.TextColumn("Customer"),
+                "customer_name": st.column_config.TextColumn("Customer"),
                 "amount": st.column_config.NumberColumn("Amount", format="₹%.2f"),
                 "notes": st.column_config.TextColumn("Notes"),
             },
@@ -829,37 +1173,119 @@ def render_lists_tab():
             key="list_allocations_date_range",
         )
         show_all = st.checkbox("Show all allocations", value=False, key="list_allocations_all")
-        rows = rows_to_dicts(db.list_partner_allocations_all())
-        if not show_all and isinstance(date_range, tuple) and len(date_range) == 2:
-            start_date, end_date = date_range
-            rows = [
-                row
-                for row in rows
-                if date_to_str(start_date) <= row["date"] <= date_to_str(end_date)
-            ]
-        display_rows = [
-            {
-                "date": row["date"],
-                "partner": row["partner_name"],
-                "item": row["item_name"],
-                "qty": row["quantity"],
-                "manager": row["manager_name"],
-            }
-            for row in rows
-        ]
+        start_date, end_date = list_date_bounds(date_range, show_all)
+        rows = keyset_page(
+            f"list_allocations_{start_date}_{end_date}",
+            lambda after_id, page_size: db.list_partner_allocations_range(
+                start_date, end_date, limit=page_size, after_id=after_id
+            ),
+        )
         st.dataframe(
-            display_rows,
+            rows,
             use_container_width=True,
+            column_order=(
+                "date",
+                "partner_name",
+                "item_name",
+                "quantity",
+                "manager_name",
+            ),
             column_config={
                 "date": st.column_config.TextColumn("Date", width="medium"),
-                "partner": st.column_config.TextColumn("Partner"),
-                "item": st.column_config.TextColumn("Item"),
-                "qty": st.column_config.NumberColumn("Qty"),
-                "manager": st.column_config.TextColumn("Manager"),
+                "partner_name": st.column_config.TextColumn("Partner"),
+                "item_name": st.column_config.TextColumn("Item"),
+                "quantity": st.column_config.NumberColumn("Qty"),
+                "manager_name": st.column_config.TextColumn("Manager"),
             },
         )
 
 
+def render_data_tab():
+    st.subheader("Data")
+    st.markdown("#### Export")
+    export_kind = st.selectbox("Export", options=list(db.EXPORTS), key="export_kind")
+    export_format = st.radio(
+        "Format", options=db.EXPORT_FORMATS, horizontal=True, key="export_format"
+    )
+    default_date = to_date(db.today_str())
+    export_range = st.date_input(
+        "Date Range", value=(default_date.replace(day=1), default_date), key="export_range"
+    )
+    export_all = st.checkbox("All dates", value=False, key="export_all")
+    start_date, end_date = list_date_bounds(export_range, export_all)
+    if st.button("Prepare Export", key="export_run"):
+        file_name = f"{export_kind}_{start_date or 'all'}_{end_date or 'all'}.{export_format}"
+        export_path = prepare_download("export_file", file_name)
+        count = db.export_to_file(export_kind, export_path, start_date, end_date, export_format)
+        st.session_state.export_file["count"] = count
+        st.session_state.export_file["mime"] = (
+            "text/csv" if export_format == "csv" else "application/x-ndjson"
+        )
+    export = st.session_state.get("export_file")
+    if export and os.path.exists(export["path"]):
+        # Streamlit serves downloads from memory, so the whole file is loaded
+        # here; very large exports are better run with db.export_to_file().
+        st.caption(f"{export['count']} rows")
+        download_col, discard_col = st.columns(2)
+        with open(export["path"], "rb") as f:
+            download_col.download_button(
+                "Download Export",
+                data=f,
+                file_name=export["file_name"],
+                mime=export["mime"],
+                key="export_download",
+            )
+        if discard_col.button("Discard Export", key="export_discard"):
+            discard_download("export_file")
+            st.rerun()
+
+    st.markdown("#### Import CSV")
+    kind = st.selectbox("Import type", options=sorted(importer.IMPORT_KINDS), key="import_kind")
+    st.caption(
+        "Columns: "
+        + ", ".join(importer.IMPORT_KINDS[kind])
+        + ". Names are matched to existing records; *_id columns may be used instead."
+    )
+    uploaded = st.file_uploader("CSV file", type=["csv"], key="import_file")
+    if uploaded is not None and st.button("Import", key="import_run"):
+        progress_bar = st.progress(0.0, text="Importing...")
+
+        def report(result):
+            progress_bar.progress(
+                min(uploaded.tell() / max(uploaded.size, 1), 1.0),
+                text=f"{result['processed']} rows read, {result['imported']} imported, "
+                f"{result['updated']} updated, {result['rejected']} rejected",
+            )
+
+        st.session_state.pop("import_result", None)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            rejects_path = os.path.join(temp_dir, f"{kind}_rejects.csv")
+            try:
+                result = importer.import_csv_bytes(kind, uploaded, rejects_path, progress=report)
+            except ValueError as exc:
+                st.error(str(exc))
+                return
+            rejects = None
+            if result["rejects_path"]:
+                with open(result["rejects_path"], "rb") as f:
+                    rejects = f.read()
+        st.session_state.import_result = (kind, result, rejects)
+
+    if "import_result" in st.session_state:
+        import_kind, result, rejects = st.session_state.import_result
+        st.success(
+            f"Imported {result['imported']} of {result['processed']} rows "
+            f"({result['updated']} updated, {result['rejected']} rejected)."
+        )
+        if rejects is not None:
+            st.download_button(
+                "Download rejected rows",
+                data=rejects,
+                file_name=f"{import_kind}_rejects.csv",
+                mime="text/csv",
+            )
+
+
 def main():
     st.set_page_config(page_title="Milk Billing System", layout="wide")
     sidebar_data_access()
@@ -877,8 +1303,8 @@ def main():
             st.sidebar.success("Logged out.")
             st.rerun()
 
-    masters, daily, stock, reports, lists = st.tabs(
-        ["Masters", "Daily Delivery", "Partner Stock", "Reports", "Lists"]
+    masters, daily, stock, reports, lists, data = st.tabs(
+        ["Masters", "Daily Delivery", "Partner Stock", "Reports", "Lists", "Data"]
     )
     with masters:
         render_masters_tab()
@@ -890,6 +1316,8 @@ def main():
         render_reports_tab()
     with lists:
         render_lists_tab()
+    with data:
+        render_data_tab()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,86 @@
+import io
+import os
+import sys
+import tempfile
+import unittest
+from datetime import date
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+import db  # noqa: E402
+import importer  # noqa: E402
+from seed_data import build_database  # noqa: E402
+
+DAY = "2025-04-01"
+HEADER = "date,customer_id,item_id,quantity,partner_id,manager_id\n"
+FIRST_ROUND = f"{DAY},1,1,2,1,1\n"
+SECOND_ROUND = f"{DAY},1,1,1,1,1\n"
+
+
+class DeliveryImportTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        build_database(
+            os.path.join(self.tmp_dir.name, "import.db"),
+            customers=5,
+            partners=2,
+            days=5,
+            end_date=date(2025, 3, 31),
+        )
+
+    def tearDown(self):
+        db.close_pools()
+        self.tmp_dir.cleanup()
+
+    def import_rows(self, *rows):
+        return importer.import_csv("deliveries", io.StringIO(HEADER + "".join(rows)))
+
+    def round_quantities(self):
+        with db.get_conn() as conn:
+            rows = conn.execute(
+                "SELECT quantity FROM daily_deliveries WHERE date = ? ORDER BY id", (DAY,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def test_rounds_are_kept_without_natural_key(self):
+        db.add_daily_delivery(DAY, 1, 1, 3, 30, 1, 1)
+        result = self.import_rows(FIRST_ROUND, SECOND_ROUND)
+        self.assertEqual((result["imported"], result["updated"]), (2, 0))
+        self.assertEqual(self.round_quantities(), [3, 2, 1])
+
+    def test_upsert_needs_natural_key(self):
+        db.add_daily_delivery(DAY, 1, 1, 3, 30, 1, 1)
+        with self.assertRaises(ValueError):
+            db.upsert_daily_delivery(DAY, 1, 1, 1, 30, 1, 1)
+        self.assertEqual(self.round_quantities(), [3])
+
+    def test_reimport_updates_with_natural_key(self):
+        self.assertTrue(db.enable_delivery_natural_key())
+        result = self.import_rows(FIRST_ROUND)
+        self.assertEqual((result["imported"], result["updated"]), (1, 0))
+        result = self.import_rows(FIRST_ROUND, SECOND_ROUND)
+        self.assertEqual((result["imported"], result["updated"]), (0, 2))
+        self.assertEqual(self.round_quantities(), [1])
+
+    def test_bulk_rejects_missing_price(self):
+        for price in (None, ""):
+            with self.subTest(price=price):
+                with self.assertRaisesRegex(ValueError, "Row 2: missing price"):
+                    db.add_daily_deliveries_bulk(
+                        [(DAY, 1, 1, 2, 30, 1, 1), (DAY, 1, 1, 2, price, 1, 1)]
+                    )
+        self.assertEqual(self.round_quantities(), [])
+
+    def test_bulk_rejects_fractional_quantity(self):
+        for quantity in (2.7, "2.7"):
+            with self.subTest(quantity=quantity):
+                with self.assertRaisesRegex(ValueError, "Row 1: quantity must be a whole number"):
+                    db.add_daily_deliveries_bulk([(DAY, 1, 1, quantity, 30, 1, 1)])
+        db.add_daily_deliveries_bulk([(DAY, 1, 1, "2.0", 30, 1, 1)])
+        self.assertEqual(self.round_quantities(), [2])
+
+
+if __name__ == "__main__":
+    unittest.main()
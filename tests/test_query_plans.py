@@ -0,0 +1,111 @@
+import os
+import re
+import sys
+import tempfile
+import unittest
+from datetime import date
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+import db  # noqa: E402
+from seed_data import build_database  # noqa: E402
+
+END_DATE = date(2025, 3, 31)
+DAY = END_DATE.strftime("%Y-%m-%d")
+MONTH_START = "2025-03-01"
+BIG_TABLES = ("daily_deliveries", "advance_payments", "partner_allocations")
+FULL_SCAN = re.compile(r"^SCAN (\w+)(?: AS (\w+))?")
+BIG_TABLE_ALIAS = re.compile(rf"\b(?:{'|'.join(BIG_TABLES)})\s+(?:AS\s+)?(\w+)")
+
+# Each managed index, with a hot entry point that should be served by it.
+HOT_QUERIES = {
+    "idx_daily_deliveries_date": lambda: db.list_daily_deliveries(DAY),
+    "idx_daily_deliveries_customer_date": lambda: db.customer_summary_range(3, MONTH_START, DAY),
+    "idx_daily_deliveries_partner_date": lambda: db.list_partner_deliveries(2, DAY),
+    "idx_advance_payments_date": lambda: db.list_advance_payments(DAY),
+    "idx_advance_payments_customer_date": lambda: db.customer_statement_range(
+        3, MONTH_START, DAY
+    ),
+    "idx_partner_allocations_date": lambda: db.list_partner_allocations_all(DAY),
+    "idx_partner_allocations_partner_date": lambda: db.partner_remaining(2, DAY),
+}
+
+OTHER_HOT_QUERIES = {
+    "list_customers_with_balance": lambda: db.list_customers_with_balance(""),
+    "monthly_customer_statement": lambda: db.monthly_customer_statement(3, DAY[:7]),
+    "partner_reconciliation": lambda: db.partner_reconciliation(DAY),
+}
+
+
+class QueryPlanTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        build_database(
+            os.path.join(cls.tmp_dir.name, "plans.db"),
+            customers=60,
+            partners=4,
+            days=40,
+            end_date=END_DATE,
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        db.close_pools()
+        cls.tmp_dir.cleanup()
+
+    def run_traced(self, func):
+        statements = []
+        with mock.patch.object(db, "_instrumented", True), mock.patch.object(
+            db, "_trace_sql", statements.append
+        ):
+            func()
+        plans = []
+        for statement in statements:
+            if not statement.lstrip().upper().startswith(("SELECT", "WITH")):
+                continue
+            plans.append((statement, db.query_plan(statement)))
+        return plans
+
+    def assert_no_full_scan(self, plans):
+        for statement, plan in plans:
+            aliases = set(BIG_TABLES)
+            aliases.update(re.findall(BIG_TABLE_ALIAS, statement))
+            for detail in plan:
+                match = FULL_SCAN.match(detail)
+                if match:
+                    self.assertNotIn(
+                        match.group(2) or match.group(1),
+                        aliases,
+                        f"{detail!r} in plan for:\n{statement}",
+                    )
+
+    def test_every_index_has_a_hot_query(self):
+        self.assertEqual(sorted(HOT_QUERIES), sorted(name for name, _, _ in db.INDEXES))
+
+    def test_hot_queries_use_their_index(self):
+        for index_name, func in HOT_QUERIES.items():
+            with self.subTest(index=index_name):
+                plans = self.run_traced(func)
+                self.assertTrue(plans)
+                details = [detail for _, plan in plans for detail in plan]
+                self.assertTrue(
+                    any(
+                        re.search(rf"USING (?:COVERING )?INDEX {index_name}\b", detail)
+                        for detail in details
+                    ),
+                    f"{index_name} not used: {details}",
+                )
+                self.assert_no_full_scan(plans)
+
+    def test_other_hot_queries_do_not_scan(self):
+        for name, func in OTHER_HOT_QUERIES.items():
+            with self.subTest(query=name):
+                self.assert_no_full_scan(self.run_traced(func))
+
+
+if __name__ == "__main__":
+    unittest.main()
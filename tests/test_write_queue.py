@@ -0,0 +1,34 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import db  # noqa: E402
+
+
+class WriteQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        db.set_db_path(os.path.join(self.tmp_dir.name, "queue.db"))
+
+    def tearDown(self):
+        db.close_pools()
+        self.tmp_dir.cleanup()
+
+    def test_write_fails_when_writer_cannot_connect(self):
+        pool = db.get_pool()
+        failure = sqlite3.OperationalError("unable to open database file")
+        with mock.patch.object(pool, "_connect", side_effect=failure):
+            with self.assertLogs(db.logger, "ERROR"), self.assertRaises(sqlite3.OperationalError):
+                db.write(db.set_setting, "shop_name", "Dairy")
+        db.write(db.set_setting, "shop_name", "Dairy")
+        self.assertEqual(db.get_setting("shop_name"), "Dairy")
+
+
+if __name__ == "__main__":
+    unittest.main()